@@ -27,10 +27,36 @@ class ElectrodeUpdater:
         """
         pass
 
-    def set_essentials(self, folder):
+    def set_essentials(self, folder, cache=None):
         """ Sets a few parameters at runtime.
 
         Parameter:
             folder: the folder which is used for persisting iteration-specific data
+            cache: (optional) An ArtifactCache for reusing generated artifacts between runs. None disables caching.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def get_update_stats(self):
+        """ Returns statistics of the last update, e.g. for convergence checks.
+
+        Returns:
+            A dictionary of statistics (e.g. 'resolution_gain') or None if the updater does not provide any.
+        """
+        return None
+
+    def get_state(self):
+        """ Returns the state needed to continue an interrupted job (see FlexibleInversionController.resume(...)).
+
+        Returns:
+            A dictionary with JSON serializable values ('values'), numpy arrays ('arrays') and schemes ('schemes'), each
+            as dictionary, or None if the updater does not keep any state between updates.
+        """
+        return None
+
+    def set_state(self, state):
+        """ Restores a state returned by get_state().
+
+        Parameter:
+            state: The state to be restored.
+        """
+        pass
@@ -2,7 +2,9 @@
 
 import logging
 import datetime
+import json
 import os
+import shutil
 
 import numpy as np
 
@@ -11,6 +13,11 @@ import pygimli as pg
 import pygimli.meshtools as mt
 
 from main.ElectrodeUpdater import ElectrodeUpdater
+from util.ArtifactCache import ArtifactCache
+from util.ElectrodeRegistry import ElectrodeRegistry
+from util.QuadrupoleTable import QuadrupoleTable
+import util.metricsUtil as metricsUtil
+import util.schemeUtil as schemeUtil
 import util.worldUtil as worldUtil
 import main.InversionConfiguration as InversionConfiguration
 
@@ -37,6 +44,7 @@ class FlexibleInversionController:
 
         self.__iteration = 0
         self.__folder = ''
+        self.__cache = None
 
         self.__world = None
         self.__scheme = None
@@ -44,12 +52,45 @@ class FlexibleInversionController:
         self.__inv_mesh = None
         self.__inv_final_mesh = None
         self.__syndata = None
+        self.__simulated_scheme = None
+        self.__sim_ert = None
+        self.__inv_ert = None
+        self.__inv_cold_iterations = 0
+        self.__chi2 = None
+        self.__stop_reason = None
+        self.__converged_iterations = 0
+        self.__stage_fingerprints = {}
         self.__inv = None
         self.__final_inv = None
         self.__fop = None
         self.__pd = None
         self.__res = []
 
+    def __create_folder(self, start_time: datetime.datetime):
+        """ Creates the job folder.
+
+        The folder name consists of the start time and the folder suffix. Jobs started within the same second (e.g. by
+        a sweep) get a counter appended, so every job gets its own folder.
+
+        Parameter:
+            start_time: The start time of the job.
+
+        Returns:
+            The path of the created folder.
+        """
+        name = self.__config.general_results_dir + 'job-{:d}{:d}{:d}-{:d}.{:d}.{:d}{}' \
+            .format(start_time.year, start_time.month, start_time.day, start_time.hour, start_time.minute,
+                    start_time.second, self.__config.general_folder_suffix)
+        folder = name
+        counter = 1
+        while True:
+            try:
+                os.mkdir(folder)
+                return folder + '/'
+            except FileExistsError:
+                counter += 1
+                folder = name + '-' + str(counter)
+
     def __create_world(self):
         """ Creates the world model.
 
@@ -78,29 +119,75 @@ class FlexibleInversionController:
         """ Creates all the used meshes.
 
         Creates the meshes for the simulation, the in-field inversion and the inversion after all data is collected.
+        When a cache is configured, meshes generated by earlier runs with the same settings and sensors are reused.
         """
-        # Add mesh nodes below the sensors based on
-        for pos in self.__scheme.sensorPositions():
-            self.__world.createNode(pos)
-            self.__world.createNode(pos + pg.RVector3(0, -self.__config.finv_spacing / 2))
+        sensor_positions = schemeUtil.get_sensor_positions(self.__scheme)
         # Create mesh for simulation based on the generated world
-        self.__sim_mesh = mt.createMesh(poly=self.__world, quality=self.__config.sim_mesh_quality,
-                                        area=self.__config.sim_mesh_maxarea)
+        self.__sim_mesh = self.__cached_mesh(
+            name='sim_mesh', create_mesh=self.__create_sim_mesh,
+            key_parts=[self.__config.world_gen, self.__config.world_x, self.__config.world_z,
+                       self.__config.world_layers, self.__config.world_angle, self.__config.world_inclusion_start,
+                       self.__config.world_inclusion_dim, self.__config.world_tile_x, self.__config.world_tile_z,
+                       self.__config.finv_spacing, self.__config.sim_mesh_quality, self.__config.sim_mesh_maxarea,
+                       sensor_positions])
         # Create parameter mesh for in-field inversion
         sensor_distance = self.__scheme.sensorPositions()[1][0] - self.__scheme.sensorPositions()[0][0]
         para_dx = self.__config.inv_dx / sensor_distance
         para_dz = self.__config.inv_dz / sensor_distance
         n_layers = int(self.__config.inv_depth/self.__config.inv_dz)
-        self.__inv_mesh = mt.createParaMesh2DGrid(sensors=self.__scheme.sensorPositions(),
-                                                  paraDX=para_dx, paraDZ=para_dz,
-                                                  paraDepth=self.__config.inv_depth, nLayers=n_layers)
+        self.__inv_mesh = self.__cached_mesh(
+            name='inv_mesh', key_parts=[para_dx, para_dz, self.__config.inv_depth, n_layers, sensor_positions],
+            create_mesh=lambda: mt.createParaMesh2DGrid(sensors=self.__scheme.sensorPositions(),
+                                                        paraDX=para_dx, paraDZ=para_dz,
+                                                        paraDepth=self.__config.inv_depth, nLayers=n_layers))
         # Create (probably finer) parameter mesh for a final inversion
         final_para_dx = self.__config.inv_final_dx / sensor_distance
         final_para_dz = self.__config.inv_final_dz / sensor_distance
         final_n_layers = int(self.__config.inv_final_depth / self.__config.inv_final_dz)
-        self.__inv_final_mesh = mt.createParaMesh2DGrid(sensors=self.__scheme.sensorPositions(),
-                                                  paraDX=final_para_dx, paraDZ=final_para_dz,
-                                                  paraDepth=self.__config.inv_final_depth, nLayers=final_n_layers)
+        self.__inv_final_mesh = self.__cached_mesh(
+            name='inv_final_mesh',
+            key_parts=[final_para_dx, final_para_dz, self.__config.inv_final_depth, final_n_layers, sensor_positions],
+            create_mesh=lambda: mt.createParaMesh2DGrid(sensors=self.__scheme.sensorPositions(),
+                                                        paraDX=final_para_dx, paraDZ=final_para_dz,
+                                                        paraDepth=self.__config.inv_final_depth,
+                                                        nLayers=final_n_layers))
+
+    def __create_sim_mesh(self):
+        """ Creates the mesh for simulation.
+
+        Creates the world model and the simulation mesh based on it.
+
+        Returns:
+            The simulation mesh.
+        """
+        logging.info('Creating world...')
+        self.__create_world()
+        # Add mesh nodes below the sensors based on
+        for pos in self.__scheme.sensorPositions():
+            self.__world.createNode(pos)
+            self.__world.createNode(pos + pg.RVector3(0, -self.__config.finv_spacing / 2))
+        return mt.createMesh(poly=self.__world, quality=self.__config.sim_mesh_quality,
+                             area=self.__config.sim_mesh_maxarea)
+
+    def __cached_mesh(self, name: str, key_parts: list, create_mesh):
+        """ Loads a mesh from the cache or creates it.
+
+        Parameter:
+            name: The name of the mesh, used as part of the cache key.
+            key_parts: Everything the mesh depends on (see ArtifactCache.fingerprint(...)).
+            create_mesh: A function creating the mesh when it is not cached.
+
+        Returns:
+            The mesh.
+        """
+        if self.__cache is None:
+            return create_mesh()
+        key = ArtifactCache.fingerprint(name, *key_parts)
+        mesh = self.__cache.load_mesh(key)
+        if mesh is None:
+            mesh = create_mesh()
+            self.__cache.save_mesh(key, mesh)
+        return mesh
 
     def __create_res_array(self):
         """ Constructs the resistivity array based on given resistivities.
@@ -113,22 +200,31 @@ class FlexibleInversionController:
             self.__res.append([i, r])
             i += 1
 
-    def __initialize(self):
+    def __initialize(self, job_folder=None):
         """ Initializes the iterative inversion process provided by the FlexibleInversionController.
 
         Initializes the iterative inversion process, checks the given configuration parameters and creates some initial
-        variables.
+        variables. When a job folder is given, the state of its last checkpoint is restored instead.
+
+        Parameter:
+            job_folder: (optional) The folder of an interrupted job to be continued.
 
         Returns:
             Whether the initialization was successful.
         """
-        # Create folder for saving all job-related information
         start_time = datetime.datetime.now()
-        self.__folder = '../inversion_results/job-{:d}{:d}{:d}-{:d}.{:d}.{:d}{}/' \
-            .format(start_time.year, start_time.month, start_time.day, start_time.hour, start_time.minute,
-                    start_time.second,
-                    self.__config.general_folder_suffix)
-        os.mkdir(self.__folder)
+        # Check integrity of configuration file before its directories are used (the job log does not exist yet)
+        config_integrity = self.__config.check_integrity()
+        if config_integrity != 0:
+            logging.error('Configuration file is NOT integer! ABORTING!')
+            logging.error('Error code ' + str(config_integrity) +
+                          '. Check InversionConfiguration.check_integrity() for detailled information')
+            return False
+        # Create folder for saving all job-related information
+        if job_folder is None:
+            self.__folder = self.__create_folder(start_time)
+        else:
+            self.__folder = job_folder if job_folder.endswith('/') else job_folder + '/'
         # Initialize logging system
         for handler in logging.root.handlers[:]:
             logging.root.removeHandler(handler)
@@ -137,21 +233,20 @@ class FlexibleInversionController:
         logging.info('Routine start time: ' + str(start_time))
         logging.info('Initializing logger successful. Logging to ' + self.__folder + 'job.log')
         logging.info('### STARTING INITIALIZATION PHASE')
+        # Start recording stage metrics
+        metricsUtil.open_metrics(file=self.__folder + 'metrics.jsonl',
+                                 trace_memory=self.__config.general_trace_memory)
         # Create temporary directory with main folder
-        os.mkdir(self.__folder + 'tmp/')
+        os.makedirs(self.__folder + 'tmp/', exist_ok=job_folder is not None)
         logging.info('Temporary directory created')
+        logging.info('Configuration file is integer!')
+        # Open cache for generated schemes and meshes
+        if self.__config.general_cache_dir is not None:
+            self.__cache = ArtifactCache(folder=self.__config.general_cache_dir,
+                                         max_mb=self.__config.general_cache_max_mb)
+            logging.info('Using cache directory ' + self.__cache.folder)
         # Broadcast folder to ElectrodeUpdater
-        self.__electrode_updater.set_essentials(folder=self.__folder)
-        # Check integrity of configuration file
-        logging.info('Checking basic configuration file integrity...')
-        config_integrity = self.__config.check_integrity()
-        if config_integrity == 0:
-            logging.info('Configuration file is integer!')
-        else:
-            logging.error('Configuration file is NOT integer! ABORTING!')
-            logging.error('Error code ' + str(config_integrity) +
-                          '. Check InversionConfiguration.check_integrity() for detailled information')
-            return False
+        self.__electrode_updater.set_essentials(folder=self.__folder, cache=self.__cache)
         # Print config values to log file for future reproducibility
         logging.info('Configuration parameters:')
         logging.info('#---------------#:')
@@ -160,13 +255,25 @@ class FlexibleInversionController:
             logging.info(conf_values[i])
         logging.info('Electrode updater: ' + str(type(self.__electrode_updater)))
         logging.info('#---------------#:')
-        # Init model and check model integrity
-        logging.info('Creating world...')
-        self.__create_world()
-        logging.info('Creating configuration scheme...')
-        self.__scheme = self.__electrode_updater.init_scheme()
-        logging.info('Creating initial mesh...')
-        self.__create_meshes()
+        if job_folder is not None:
+            logging.info('Resuming job from checkpoint...')
+            if not self.__load_checkpoint():
+                return False
+        else:
+            # Init model and check model integrity
+            logging.info('Creating configuration scheme...')
+            with metricsUtil.stage('init_scheme'):
+                self.__scheme = self.__electrode_updater.init_scheme()
+            logging.info('Creating initial mesh...')
+            with metricsUtil.stage('create_meshes', electrodes=len(self.__scheme.sensorPositions())) as record:
+                self.__create_meshes()
+                record['nm'] = self.__sim_mesh.cellCount()
+            if self.__config.general_checkpoint:
+                # The meshes do not change during a run and are stored once
+                storage = ArtifactCache(folder=self.__folder + 'checkpoint/')
+                storage.save_mesh('sim_mesh', self.__sim_mesh)
+                storage.save_mesh('inv_mesh', self.__inv_mesh)
+                storage.save_mesh('inv_final_mesh', self.__inv_final_mesh)
         logging.info('Checking model integrity...')
         res_count = np.unique(ar=np.array(self.__sim_mesh.cellMarkers()), return_inverse=True)
         if len(res_count[0]) != len(self.__config.world_resistivities):
@@ -182,20 +289,40 @@ class FlexibleInversionController:
     def __simulate(self, folder):
         """ Simulates a measurement set.
 
-        Creates a set of synthetic data based on world, noise and given electrode configurations.
+        Creates a set of synthetic data based on world, noise and given electrode configurations. In incremental mode,
+        only configurations which were not simulated before are simulated and appended to the accumulated dataset.
 
         Parameter:
             folder: The folder in which the resulting syndata.dat will be saved.
         """
-        ert = pb.ERTManager()
+        if self.__sim_ert is None:
+            self.__sim_ert = pb.ERTManager()
+        scheme = self.__scheme
+        if self.__config.sim_incremental and self.__simulated_scheme is not None:
+            # Find configurations which were not simulated yet
+            registry = ElectrodeRegistry()
+            simulated = QuadrupoleTable.from_scheme(self.__simulated_scheme, registry)
+            new_indices = simulated.union(QuadrupoleTable.from_scheme(self.__scheme, registry))
+            logging.info('Simulating {:d} new configurations'.format(len(new_indices)))
+            if len(new_indices) == 0:
+                self.__syndata.save(folder + 'syndata.dat')
+                return
+            scheme = schemeUtil.extract_configs_from_scheme(scheme=self.__scheme, config_indices=new_indices)
         # Simulate synthetic data using pybert
-        self.__syndata = ert.simulate(mesh=self.__sim_mesh, res=self.__res, scheme=self.__scheme,
-                                      verbose=self.__config.general_bert_verbose,
-                                      noiseLevel=self.__config.sim_noise_level,
-                                      noiseAbs=self.__config.sim_noise_abs)
+        syndata = self.__sim_ert.simulate(mesh=self.__sim_mesh, res=self.__res, scheme=scheme,
+                                          verbose=self.__config.general_bert_verbose,
+                                          noiseLevel=self.__config.sim_noise_level,
+                                          noiseAbs=self.__config.sim_noise_abs)
         # Removing invalid data
-        self.__syndata.markInvalid(self.__syndata('rhoa') < 0)
-        self.__syndata.removeInvalid()
+        syndata.markInvalid(syndata('rhoa') < 0)
+        syndata.removeInvalid()
+        # Append data to already measured data
+        if self.__config.sim_incremental and self.__simulated_scheme is not None:
+            self.__simulated_scheme = schemeUtil.merge_schemes(scheme1=self.__simulated_scheme, scheme2=scheme)
+            self.__syndata = schemeUtil.merge_schemes(scheme1=self.__syndata, scheme2=syndata)
+        else:
+            self.__simulated_scheme = scheme
+            self.__syndata = syndata
         # Saving dataset to file
         self.__syndata.save(folder + 'syndata.dat')
 
@@ -203,21 +330,62 @@ class FlexibleInversionController:
         """ Inverts the synthetic dataset.
 
         Inverts the simulated, synthetic dataset created by __simulate(...). The default inversion mesh will be used.
+        In warm start mode, the inversion starts from the previous model and reuses the previous ERTManager (forward
+        operator and region setup) with a capped iteration count. The mesh is only passed on cold starts, as passing it
+        again would set up the forward operator and regions anew.
 
         Parameter:
             folder: The folder in which the inversion result will be saved.
         """
-        ert = pb.ERTManager()
+        warm_start = self.__config.inv_warm_start and self.__inv_ert is not None and self.__inv is not None \
+            and len(self.__inv) == self.__pd.cellCount()
+        if warm_start:
+            # Passing the mesh again would make the manager set up its mesh, regions and forward operator anew
+            ert = self.__inv_ert
+            kwargs = {'startModel': self.__inv}
+            if self.__config.inv_warm_max_iter is not None:
+                kwargs['maxIter'] = self.__config.inv_warm_max_iter
+        else:
+            ert = pb.ERTManager()
+            kwargs = {'mesh': self.__inv_mesh}
         # Invert data
-        self.__inv = ert.invert(data=self.__syndata,
-                                lam=self.__config.inv_lambda, mesh=self.__inv_mesh,
-                                verbose=self.__config.general_bert_verbose)
+        self.__inv = ert.invert(data=self.__syndata, lam=self.__config.inv_lambda,
+                                verbose=self.__config.general_bert_verbose, **kwargs)
+        self.__chi2 = ert.inv.chi2()
+        logging.info('Inversion chi2: {:f}'.format(self.__chi2))
+        # Log iteration counts for comparing warm and cold starts
+        iterations = self.__get_inversion_iterations(ert) if self.__config.inv_warm_start else None
+        if iterations is not None:
+            if warm_start:
+                logging.info('Warm-started inversion finished after {:d} iterations ({:d} saved)'.format(
+                    iterations, max(self.__inv_cold_iterations - iterations, 0)))
+            else:
+                self.__inv_cold_iterations = iterations
+                logging.info('Inversion finished after {:d} iterations'.format(iterations))
         # Save inversion results which are needed for further computations
         self.__fop = ert.fop
         self.__pd = ert.paraDomain
+        if self.__config.inv_warm_start:
+            self.__inv_ert = ert
         # Save inversion results to file
         ert.saveResult(folder)
 
+    @staticmethod
+    def __get_inversion_iterations(ert: pb.ERTManager):
+        """ Returns the Gauss-Newton iteration count of the last inversion of an ERTManager.
+
+        Parameter:
+            ert: The ERTManager.
+
+        Returns:
+            The iteration count or None if the pybert version does not provide it.
+        """
+        try:
+            return int(ert.inv.iter())
+        except (AttributeError, TypeError):
+            logging.info('Inversion iteration count not available')
+            return None
+
     def __final_invert(self, folder):
         """ Inverts the synthetic dataset on the final mesh.
 
@@ -235,46 +403,310 @@ class FlexibleInversionController:
         # Save inversion results to file
         ert.saveResult(folder)
 
+    def __stage_changed(self, stage: str, *inputs):
+        """ Checks whether the inputs of a stage changed since its last run.
+
+        Utility method to skip stages whose results would not change, e.g. simulating and inverting the same scheme
+        again when the electrode updater did not add any configurations. The inputs are compared by their fingerprints
+        (see ArtifactCache.fingerprint(...)).
+
+        Parameter:
+            stage: The name of the stage.
+            inputs: Everything the stage depends on, apart from settings which do not change during a run.
+
+        Returns:
+            Whether the stage has to be run.
+        """
+        fingerprint = ArtifactCache.fingerprint(stage, *inputs)
+        if self.__stage_fingerprints.get(stage) == fingerprint:
+            logging.info('Inputs of stage "' + stage + '" unchanged. Reusing previous results')
+            return False
+        self.__stage_fingerprints[stage] = fingerprint
+        return True
+
+    def __fingerprint_scheme(self, scheme: pb.DataContainerERT, tokens=None):
+        """ Collects the content of a scheme which identifies it for fingerprinting.
+
+        Parameter:
+            scheme: The scheme.
+            tokens: (optional) Data tokens to be included besides the sensor positions and electrode indices.
+
+        Returns:
+            A list of arrays describing the scheme.
+        """
+        columns = schemeUtil.get_columns(scheme, tokens=schemeUtil.SENSOR_TOKENS + ([] if tokens is None else tokens))
+        return [schemeUtil.get_sensor_positions(scheme)] + [columns[token] for token in sorted(columns)]
+
+    def __check_convergence(self, previous_model: np.ndarray, previous_chi2: float):
+        """ Checks the configured stopping criteria after an inversion and electrode update.
+
+        The enabled criteria are the relative change of the log model, the relative change of chi^2 and the mean
+        resolution gain of the electrode update (see ElectrodeUpdater.get_update_stats()). All of them have to be below
+        their thresholds for finv_stop_patience consecutive iterations.
+
+        Parameter:
+            previous_model: The model of the previous in-field inversion (None in the first one).
+            previous_chi2: The chi^2 of the previous in-field inversion (None in the first one).
+
+        Returns:
+            The reason for stopping or None if the iterations should go on.
+        """
+        criteria = []
+        if self.__config.finv_stop_model_change is not None:
+            model_change = None
+            if previous_model is not None and len(previous_model) == len(self.__inv):
+                log_previous = np.log(previous_model)
+                model_change = np.linalg.norm(np.log(np.array(self.__inv)) - log_previous) / \
+                    np.linalg.norm(log_previous)
+            criteria.append(('model change', model_change, self.__config.finv_stop_model_change))
+        if self.__config.finv_stop_chi2_change is not None:
+            chi2_change = None
+            if previous_chi2 is not None and previous_chi2 > 0:
+                chi2_change = abs(self.__chi2 - previous_chi2) / previous_chi2
+            criteria.append(('chi2 change', chi2_change, self.__config.finv_stop_chi2_change))
+        if self.__config.finv_stop_resolution_gain is not None:
+            stats = self.__electrode_updater.get_update_stats()
+            resolution_gain = None if stats is None else stats['resolution_gain']
+            criteria.append(('resolution gain', resolution_gain, self.__config.finv_stop_resolution_gain))
+        if len(criteria) == 0:
+            return None
+        # Check whether all criteria are met
+        states = []
+        for name, value, threshold in criteria:
+            if value is None:
+                states.append('{}: not available (threshold {})'.format(name, threshold))
+            elif value < threshold:
+                states.append('{}: {} < {} (met)'.format(name, value, threshold))
+            else:
+                states.append('{}: {} >= {} (not met)'.format(name, value, threshold))
+        logging.info('Stopping criteria: ' + ', '.join(states))
+        if all(value is not None and value < threshold for _, value, threshold in criteria):
+            self.__converged_iterations += 1
+        else:
+            self.__converged_iterations = 0
+        if self.__converged_iterations >= self.__config.finv_stop_patience:
+            reason = ', '.join('{}: {} < {}'.format(name, value, threshold) for name, value, threshold in criteria)
+            logging.info('Stopping: ' + reason)
+            return reason
+        return None
+
+    def __save_checkpoint(self, finished=False):
+        """ Stores the state of the job after a completed iteration.
+
+        The schemes, the simulated data, the last model and the electrode updater state (see
+        ElectrodeUpdater.get_state()) are stored as .npz files in a folder per iteration, all other values in
+        checkpoint.json. The checkpoint.json is replaced last, so an interruption while checkpointing leaves the
+        previous checkpoint intact. Older iteration folders are removed afterwards.
+
+        Parameter:
+            finished: (optional) Whether the job finished, so there is nothing left to resume.
+        """
+        checkpoint_folder = self.__folder + 'checkpoint/'
+        iteration_subfolder = 'iteration' + str(self.__iteration) + '/'
+        storage = ArtifactCache(folder=checkpoint_folder + iteration_subfolder)
+        storage.save_scheme('scheme', self.__scheme)
+        storage.save_scheme('syndata', self.__syndata)
+        if self.__simulated_scheme is not None:
+            storage.save_scheme('simulated_scheme', self.__simulated_scheme)
+        if self.__inv is not None:
+            storage.save_arrays('inv', {'inv': np.array(self.__inv)})
+        updater_state = self.__electrode_updater.get_state()
+        if updater_state is not None:
+            storage.save_arrays('updater', updater_state['arrays'])
+            for name, scheme in updater_state['schemes'].items():
+                storage.save_scheme('updater_' + name, scheme)
+        info = {'iteration': self.__iteration, 'folder': iteration_subfolder, 'finished': finished,
+                'chi2': None if self.__chi2 is None else float(self.__chi2), 'stop_reason': self.__stop_reason,
+                'converged_iterations': self.__converged_iterations,
+                'inv_cold_iterations': int(self.__inv_cold_iterations),
+                'stage_fingerprints': self.__stage_fingerprints, 'has_inv': self.__inv is not None,
+                'has_simulated_scheme': self.__simulated_scheme is not None,
+                'updater_values': None if updater_state is None else updater_state['values'],
+                'updater_schemes': [] if updater_state is None else list(updater_state['schemes']),
+                'config': vars(self.__config)}
+        tmp_file = checkpoint_folder + 'checkpoint.json.tmp{:d}'.format(os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(info, f, indent=2, default=str)
+        os.replace(tmp_file, checkpoint_folder + 'checkpoint.json')
+        for name in os.listdir(checkpoint_folder):
+            if name.startswith('iteration') and name + '/' != iteration_subfolder:
+                shutil.rmtree(checkpoint_folder + name)
+        logging.info('Checkpoint of iteration {:d} saved'.format(self.__iteration))
+
+    def __load_checkpoint(self):
+        """ Restores the state of the job from its last checkpoint (see __save_checkpoint(...)).
+
+        Returns:
+            Whether there is a checkpoint to be continued.
+        """
+        checkpoint_folder = self.__folder + 'checkpoint/'
+        if not os.path.exists(checkpoint_folder + 'checkpoint.json'):
+            logging.error('No checkpoint found in ' + checkpoint_folder + '! ABORTING!')
+            return False
+        with open(checkpoint_folder + 'checkpoint.json') as f:
+            info = json.load(f)
+        if info['finished']:
+            logging.info('Job already finished. Nothing to resume')
+            return False
+        if info['config'] != json.loads(json.dumps(vars(self.__config), default=str)):
+            logging.info('Configuration differs from the checkpointed configuration. Continuing with the given one')
+        storage = ArtifactCache(folder=checkpoint_folder)
+        self.__sim_mesh = storage.load_mesh('sim_mesh')
+        self.__inv_mesh = storage.load_mesh('inv_mesh')
+        self.__inv_final_mesh = storage.load_mesh('inv_final_mesh')
+        storage = ArtifactCache(folder=checkpoint_folder + info['folder'])
+        self.__scheme = storage.load_scheme('scheme')
+        self.__syndata = storage.load_scheme('syndata')
+        if info['has_simulated_scheme']:
+            self.__simulated_scheme = storage.load_scheme('simulated_scheme')
+        if info['has_inv']:
+            self.__inv = storage.load_arrays('inv')['inv']
+        if info['updater_values'] is not None:
+            self.__electrode_updater.set_state({
+                'values': info['updater_values'], 'arrays': storage.load_arrays('updater'),
+                'schemes': {name: storage.load_scheme('updater_' + name) for name in info['updater_schemes']}})
+        self.__iteration = info['iteration']
+        self.__chi2 = info['chi2']
+        self.__stop_reason = info['stop_reason']
+        self.__converged_iterations = info['converged_iterations']
+        self.__inv_cold_iterations = info['inv_cold_iterations']
+        self.__stage_fingerprints = info['stage_fingerprints']
+        # The forward operator is not checkpointed, so the next inversion always has to run
+        self.__stage_fingerprints.pop('invert', None)
+        logging.info('Resuming after iteration {:d}'.format(self.__iteration))
+        return True
+
     def __run_iteration(self):
         """ Performs a single iteration.
 
         Runs all steps needed for a single iteration including simulation, inversion and the electrode configuration
-        update. Automatically does the final inversion when the last iteration is reached.
+        update. Automatically does the final inversion when the last iteration is reached or the stopping criteria
+        are met (see __check_convergence(...)).
         """
-        # Final inversion when the maximum iteration amount is reached.
-        if self.__iteration >= self.__config.finv_max_iterations:
-            logging.info('### MAX ITERATIONS REACHED')
+        # Final inversion when the maximum iteration amount is reached or the stopping criteria are met.
+        if self.__iteration >= self.__config.finv_max_iterations or self.__stop_reason is not None:
+            if self.__stop_reason is None:
+                logging.info('### MAX ITERATIONS REACHED')
+            else:
+                logging.info('### CONVERGED (' + self.__stop_reason + ')')
             logging.info('Inverting data on final mesh ...')
             folder = self.__folder + 'final_inv/'
-            os.mkdir(folder)
-            self.__final_invert(folder)
+            os.makedirs(folder, exist_ok=True)
+            with metricsUtil.stage('final_invert', nd=self.__syndata.size(),
+                                   nm=self.__inv_final_mesh.cellCount()):
+                self.__final_invert(folder)
             return False
         # Inverting data and computing new electrode configurations
         self.__iteration = self.__iteration + 1
         logging.info('### ITERATION ' + str(self.__iteration))
         iteration_subfolder = 'iteration' + str(self.__iteration) + '/'
         folder = self.__folder + iteration_subfolder
-        os.mkdir(folder)
+        # The folder may exist when a job is resumed after an interrupted iteration
+        os.makedirs(folder, exist_ok=True)
         if self.__iteration != 1:
-            logging.info('Inverting data ...')
-            self.__invert(folder)
-            logging.info('Updating scheme ...')
-            self.__scheme = self.__electrode_updater.update_scheme(
-                old_scheme=self.__scheme, fop=self.__fop, inv_grid=self.__pd, inv_result=self.__inv,
-                iteration_subdir=iteration_subfolder)
+            previous_model = None if self.__inv is None else np.array(self.__inv)
+            previous_chi2 = self.__chi2
+            if self.__stage_changed('invert', *self.__fingerprint_scheme(self.__syndata, tokens=['rhoa', 'err'])):
+                logging.info('Inverting data ...')
+                with metricsUtil.stage('invert', iteration=self.__iteration, nd=self.__syndata.size(),
+                                       nm=self.__inv_mesh.cellCount()):
+                    self.__invert(folder)
+            if self.__stage_changed('update', *self.__fingerprint_scheme(self.__scheme), np.array(self.__inv)):
+                logging.info('Updating scheme ...')
+                with metricsUtil.stage('update_scheme', iteration=self.__iteration,
+                                       nd=self.__scheme.size(), nm=self.__pd.cellCount()):
+                    self.__scheme = self.__electrode_updater.update_scheme(
+                        old_scheme=self.__scheme, fop=self.__fop, inv_grid=self.__pd, inv_result=self.__inv,
+                        iteration_subdir=iteration_subfolder)
+            self.__stop_reason = self.__check_convergence(previous_model=previous_model, previous_chi2=previous_chi2)
         # Simulate data with updated configurations
-        logging.info('Simulating data ({:d} electrodes, {:d} configurations)...'.format(
-            len(self.__scheme.sensorPositions()), len(self.__scheme('rhoa'))))
-        self.__simulate(folder=folder)
+        if self.__stage_changed('simulate', *self.__fingerprint_scheme(self.__scheme)):
+            logging.info('Simulating data ({:d} electrodes, {:d} configurations)...'.format(
+                len(self.__scheme.sensorPositions()), len(self.__scheme('rhoa'))))
+            with metricsUtil.stage('simulate', iteration=self.__iteration, nd=self.__scheme.size(),
+                                   electrodes=len(self.__scheme.sensorPositions()),
+                                   nm=self.__sim_mesh.cellCount()):
+                self.__simulate(folder=folder)
         return True
 
+    def get_folder(self):
+        """ Returns the job folder (empty before the job was started). """
+        return self.__folder
+
+    def get_result(self):
+        """ Returns a short summary of the job, e.g. for comparing the jobs of a sweep.
+
+        Returns:
+            A dictionary with the job folder ('folder'), the count of completed iterations ('iterations'), the reason
+            of an early stop ('stop_reason', None when the maximum iteration count was reached), the chi^2 of the last
+            in-field inversion ('chi2') and the count of configurations used ('configurations').
+        """
+        return {'folder': self.__folder, 'iterations': self.__iteration, 'stop_reason': self.__stop_reason,
+                'chi2': self.__chi2, 'configurations': None if self.__scheme is None else self.__scheme.size()}
+
+    @staticmethod
+    def load_config(job_folder: str):
+        """ Loads the configuration of a checkpointed job, e.g. for resuming it.
+
+        Parameter:
+            job_folder: The folder of the job.
+
+        Returns:
+            The InversionConfiguration the job was started with.
+        """
+        with open(os.path.join(job_folder, 'checkpoint', 'checkpoint.json')) as f:
+            return InversionConfiguration.InversionConfiguration(**json.load(f)['config'])
+
+    @staticmethod
+    def load_updater_settings(job_folder: str):
+        """ Loads the electrode updater parameters of a checkpointed job, e.g. for resuming it.
+
+        Parameter:
+            job_folder: The folder of the job.
+
+        Returns:
+            The checkpointed parameters (see ResolutionElectrodeUpdater.get_settings()) or an empty dictionary if the
+            electrode updater did not store any.
+        """
+        with open(os.path.join(job_folder, 'checkpoint', 'checkpoint.json')) as f:
+            updater_values = json.load(f)['updater_values']
+        if updater_values is None or updater_values.get('settings') is None:
+            return {}
+        return dict(updater_values['settings'])
+
     def run(self):
         """ Entry point for starting the iterative measurement process.
 
         Controls the basics of the iterative measurement process by initializing and running the single iterations.
         """
-        if self.__initialize():
+        self.__run(job_folder=None)
+
+    def resume(self, job_folder: str):
+        """ Entry point for continuing an interrupted job from its last checkpoint.
+
+        Restores the state after the last completed iteration (see InversionConfiguration.general_checkpoint) and
+        continues with the next iteration in the same job folder. The controller should be created with the
+        configuration of the job (see load_config(...)) and a new electrode updater of the same type. The first
+        inversion after resuming is always started cold.
+
+        Parameter:
+            job_folder: The folder of the interrupted job.
+        """
+        self.__run(job_folder=job_folder)
+
+    def __run(self, job_folder):
+        """ Initializes (or restores) the job and runs all iterations.
+
+        Parameter:
+            job_folder: The folder of the job to be continued or None for a new job.
+        """
+        if self.__initialize(job_folder=job_folder):
             run_loop = True
             while run_loop:
                 run_loop = self.__run_iteration()
+                if self.__config.general_checkpoint:
+                    with metricsUtil.stage('checkpoint', iteration=self.__iteration):
+                        self.__save_checkpoint(finished=not run_loop)
+            metricsUtil.log_summary(file=self.__folder + 'metrics_summary.txt')
+        metricsUtil.close_metrics()
         logging.info('Routine end time: ' + str(datetime.datetime.now()))
@@ -47,6 +47,32 @@ class InversionConfiguration:
         finv_addconfig_count: An int describing the configuration count added per iteration.
         finv_li_threshold: A float indicating the maximum value the li function of a configuration is allowed to have to
                            be still accepted.
+        general_cache_dir: (optional) A string setting a directory for caching generated schemes and meshes between
+                           runs. None disables the cache.
+        general_cache_max_mb: (optional) A float setting the size limit of the cache directory in MB. The least recently
+                              used entries are removed when the limit is exceeded. None disables the limit.
+        general_trace_memory: (optional) A boolean indicating if the peak memory allocation of every stage should be
+                              traced with tracemalloc and written to the metrics file. Slows down the computation.
+        general_results_dir: (optional) A string setting the directory in which the job folder is created.
+        general_checkpoint: (optional) A boolean indicating if the job state should be checkpointed after every
+                            iteration, so that an interrupted job can be continued with
+                            FlexibleInversionController.resume(...).
+        sim_incremental: (optional) A boolean indicating if only newly added configurations should be simulated. The
+                         data of already simulated configurations is kept like in a real measurement. If disabled, the
+                         whole scheme is simulated again in every iteration.
+        inv_warm_start: (optional) A boolean indicating if every in-field inversion should start from the previous
+                        iteration's model, reusing the forward operator and region setup of the previous inversion.
+        inv_warm_max_iter: (optional) An int capping the Gauss-Newton iterations of warm-started inversions. None
+                           keeps the pybert default.
+        finv_stop_model_change: (optional) A float setting the relative model change (of the log resistivities) between
+                                two in-field inversions below which the model counts as converged. None disables the
+                                criterion.
+        finv_stop_chi2_change: (optional) A float setting the relative chi^2 change between two in-field inversions
+                               below which the data fit counts as converged. None disables the criterion.
+        finv_stop_resolution_gain: (optional) A float setting the mean resolution gain of an electrode update below
+                                   which the resolution counts as converged. None disables the criterion.
+        finv_stop_patience: (optional) An int setting how many consecutive iterations all enabled stopping criteria
+                            have to be met before the final inversion is started early.
 
     Typical usage example:
       config = InversionConfiguration(...)
@@ -61,10 +87,19 @@ class InversionConfiguration:
                  inv_lambda: float, inv_dx: float, inv_dz: float, inv_depth: float,
                  inv_final_lambda: float, inv_final_dx: float, inv_final_dz: float, inv_final_depth: float,
                  finv_max_iterations: int, finv_spacing: float, finv_base_configs: list, finv_add_configs: list,
-                 finv_gradient_weight: float, finv_addconfig_count: int, finv_li_threshold: float):
+                 finv_gradient_weight: float, finv_addconfig_count: int, finv_li_threshold: float,
+                 general_cache_dir=None, general_cache_max_mb=None, general_trace_memory=False, sim_incremental=True,
+                 inv_warm_start=False, inv_warm_max_iter=5, finv_stop_model_change=None, finv_stop_chi2_change=None,
+                 finv_stop_resolution_gain=None, finv_stop_patience=1, general_results_dir='../inversion_results/',
+                 general_checkpoint=True):
         # General parameter
         self.general_bert_verbose = general_bert_verbose
         self.general_folder_suffix = general_folder_suffix
+        self.general_cache_dir = general_cache_dir
+        self.general_cache_max_mb = general_cache_max_mb
+        self.general_trace_memory = general_trace_memory
+        self.general_results_dir = general_results_dir
+        self.general_checkpoint = general_checkpoint
         # World parameter
         self.world_x = world_x
         self.world_z = world_z
@@ -86,11 +121,14 @@ class InversionConfiguration:
         self.sim_mesh_maxarea = sim_mesh_maxarea
         self.sim_noise_level = sim_noise_level
         self.sim_noise_abs = sim_noise_abs
+        self.sim_incremental = sim_incremental
         # Inversion parameter
         self.inv_lambda = inv_lambda
         self.inv_dx = inv_dx
         self.inv_dz = inv_dz
         self.inv_depth = inv_depth
+        self.inv_warm_start = inv_warm_start
+        self.inv_warm_max_iter = inv_warm_max_iter
         # Final inversion parameter
         self.inv_final_lambda = inv_final_lambda
         self.inv_final_dx = inv_final_dx
@@ -104,6 +142,10 @@ class InversionConfiguration:
         self.finv_gradient_weight = finv_gradient_weight
         self.finv_addconfig_count = finv_addconfig_count
         self.finv_li_threshold = finv_li_threshold
+        self.finv_stop_model_change = finv_stop_model_change
+        self.finv_stop_chi2_change = finv_stop_chi2_change
+        self.finv_stop_resolution_gain = finv_stop_resolution_gain
+        self.finv_stop_patience = finv_stop_patience
 
     def check_integrity(self) -> int:
         """Checks the configuration objects integrity.
@@ -166,6 +208,29 @@ class InversionConfiguration:
         if isinstance(self.finv_li_threshold, list):
             return 15
 
+        if (self.general_cache_dir is not None and not isinstance(self.general_cache_dir, str)) \
+                or isinstance(self.general_cache_max_mb, list):
+            return 16
+
+        if not isinstance(self.sim_incremental, bool):
+            return 17
+
+        if not isinstance(self.inv_warm_start, bool) or isinstance(self.inv_warm_max_iter, list):
+            return 18
+
+        if isinstance(self.finv_stop_model_change, list) or isinstance(self.finv_stop_chi2_change, list) \
+                or isinstance(self.finv_stop_resolution_gain, list) or isinstance(self.finv_stop_patience, list):
+            return 19
+
+        if not isinstance(self.general_trace_memory, bool):
+            return 20
+
+        if not isinstance(self.general_results_dir, str):
+            return 21
+
+        if not isinstance(self.general_checkpoint, bool):
+            return 22
+
         return 0
 
     def print_config(self) -> list:
@@ -179,7 +244,12 @@ class InversionConfiguration:
             Example: ['Bert Verbose: True','World X: 200', ...]
         """
         conf_string = ['Bert Verbose: ' + str(self.general_bert_verbose),
-                       'Folder suffix: ' + str(self.general_folder_suffix), 'World X: ' + str(self.world_x),
+                       'Folder suffix: ' + str(self.general_folder_suffix),
+                       'Cache directory: ' + str(self.general_cache_dir),
+                       'Cache size limit (MB): ' + str(self.general_cache_max_mb),
+                       'Trace memory: ' + str(self.general_trace_memory),
+                       'Results directory: ' + str(self.general_results_dir),
+                       'Checkpoints: ' + str(self.general_checkpoint), 'World X: ' + str(self.world_x),
                        'World Z: ' + str(self.world_z), 'World resistivities: ' + str(self.world_resistivities),
                        'World generator: ' + str(self.world_gen)]
 
@@ -201,11 +271,14 @@ class InversionConfiguration:
         conf_string.append('Mesh max area: ' + str(self.sim_mesh_maxarea))
         conf_string.append('Noise level: ' + str(self.sim_noise_level))
         conf_string.append('Absolute noise: ' + str(self.sim_noise_abs))
+        conf_string.append('Incremental simulation: ' + str(self.sim_incremental))
 
         conf_string.append('Lambda: ' + str(self.inv_lambda))
         conf_string.append('Inv DX: ' + str(self.inv_dx))
         conf_string.append('Inv DZ: ' + str(self.inv_dz))
         conf_string.append('Inv Depth: ' + str(self.inv_depth))
+        conf_string.append('Inv warm start: ' + str(self.inv_warm_start))
+        conf_string.append('Inv warm start max iterations: ' + str(self.inv_warm_max_iter))
 
         conf_string.append('Final Inv Lambda: ' + str(self.inv_final_lambda))
         conf_string.append('Final Inv DX: ' + str(self.inv_final_dx))
@@ -219,5 +292,9 @@ class InversionConfiguration:
         conf_string.append('Gradient weight: ' + str(self.finv_gradient_weight))
         conf_string.append('Configs to add: ' + str(self.finv_addconfig_count))
         conf_string.append('Inner products threshold: ' + str(self.finv_li_threshold))
+        conf_string.append('Stop at model change: ' + str(self.finv_stop_model_change))
+        conf_string.append('Stop at chi2 change: ' + str(self.finv_stop_chi2_change))
+        conf_string.append('Stop at resolution gain: ' + str(self.finv_stop_resolution_gain))
+        conf_string.append('Stop patience: ' + str(self.finv_stop_patience))
 
         return conf_string
\ No newline at end of file
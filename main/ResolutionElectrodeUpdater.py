@@ -1,3 +1,4 @@
+import json
 import logging
 
 import numpy as np
@@ -5,7 +6,13 @@ import pybert as pb
 import pygimli as pg
 
 from main.ElectrodeUpdater import ElectrodeUpdater
+from util.ArtifactCache import ArtifactCache
+from util.JacobianStore import JacobianStore
+import util.jacobianUtil as jacobianUtil
+import util.meshUtil as meshUtil
+import util.metricsUtil as metricsUtil
 import util.schemeUtil as schemeUtil
+import util.sensitivityUtil as sensitivityUtil
 
 class ResolutionElectrodeUpdater(ElectrodeUpdater):
     """ An ElectrodeUpdater-implementation providing the update based on subsurface resolution.
@@ -24,13 +31,43 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
                          resolution. 0 disables the usage of the gradients, 1 only uses the gradient as criterion.
         addconfig_count: Number of configurations to be added per iteration.
         li_threshold: A float, which li value is the highest possible for accepting an electrode configuration.
+        resolution_rcond: (optional) A float setting the relative singular value truncation used for the resolution
+                          matrices. The default equals the truncation of np.linalg.pinv.
+        resolution_damping: (optional) A float damping the squared singular values of the resolution matrices. 0
+                            disables damping.
+        resolution_rank: (optional) An int enabling a randomized SVD of this rank for the comprehensive resolution
+                         matrix. None computes the exact resolution.
+        refactor_tolerance: (optional) A float setting the relative change of the (logarithmic) inversion model up to
+                            which the factorization of the base Jacobian is reused and only extended by the added
+                            configurations. 0 refactorizes whenever the model changes.
+        li_mode: (optional) A string selecting the linear independence check. 'base' compares every candidate with
+                 each configuration in use, 'greedy' compares it with the subspace spanned by the configurations in use
+                 and the configurations selected before within the same update.
+        max_geometric_factor: (optional) A float setting the highest absolute geometric factor of a configuration to be
+                              used as candidate. None only removes configurations without finite geometric factor.
+        jacobian_workers: (optional) An int setting the count of processes computing the comprehensive Jacobian.
+        jacobian_chunk_size: (optional) An int setting the maximum configuration count per Jacobian chunk. None uses one
+                             chunk per worker.
+        jacobian_store_dtype: (optional) A numpy data type or its name (e.g. np.float32) enabling a memory-mapped
+                              storage of the comprehensive Jacobian in the tmp folder. Together with
+                              jacobian_chunk_size, this bounds the memory needed for the Jacobian. None keeps the
+                              Jacobian in memory.
+        max_memory_mb: (optional) A float enabling the streamed candidate selection, which sizes the Jacobian chunks
+                       and the row blocks of the resolution computation to roughly stay within this memory budget (in
+                       MB) and never holds the comprehensive Jacobian. The nm x nm factors of the resolution
+                       computation (nm: cell count) are not covered by the budget.
+        streaming_pool_factor: (optional) An int setting how many times more candidates than configurations to add are
+                               kept for the greedy selection in the streamed candidate selection.
 
     Typical usage example:
         electrode_updater = ResolutionElectrodeUpdater(...)
         fic = FlexibleInversionController(..., electrode_updater)
     """
     def __init__(self, world_x: float, spacing: float, electrode_offset: float, base_configs: list, add_configs: list,
-                 gradient_weight: float, addconfig_count: int, li_threshold: float):
+                 gradient_weight: float, addconfig_count: int, li_threshold: float, resolution_rcond=1e-15,
+                 resolution_damping=0.0, resolution_rank=None, refactor_tolerance=0.0, li_mode='base',
+                 max_geometric_factor=None, jacobian_workers=1, jacobian_chunk_size=None,
+                 jacobian_store_dtype=None, max_memory_mb=None, streaming_pool_factor=10):
         self.__world_x = world_x
         self.__spacing = spacing
         self.__electrode_offset = electrode_offset
@@ -39,11 +76,28 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
         self.__gradient_weight = gradient_weight
         self.__addconfig_count = addconfig_count
         self.__li_threshold = li_threshold
+        self.__resolution_rcond = resolution_rcond
+        self.__resolution_damping = resolution_damping
+        self.__resolution_rank = resolution_rank
+        self.__refactor_tolerance = refactor_tolerance
+        self.__li_mode = li_mode
+        self.__max_geometric_factor = max_geometric_factor
+        self.__jacobian_workers = jacobian_workers
+        self.__jacobian_chunk_size = jacobian_chunk_size
+        self.__jacobian_store_dtype = jacobian_store_dtype
+        self.__max_memory_mb = max_memory_mb
+        self.__streaming_pool_factor = streaming_pool_factor
+        self.__base_basis = None
+        self.__base_model = None
         self.__comp_scheme = None
         self.__folder_tmp = None
+        self.__cache = None
+        self.__adjacency = None
         self.__iteration = 0
+        self.__candidate_scores = None
+        self.__update_stats = None
 
-    def set_essentials(self, folder: str):
+    def set_essentials(self, folder: str, cache=None):
         """ Sets a few parameters at runtime.
 
         Utility method for setting parameters at runtime (or after FlexibleInversionController construction) which can
@@ -51,8 +105,126 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
 
         Parameter:
             folder: the folder which is used for persisting iteration-specific data
+            cache: (optional) An ArtifactCache for reusing the comprehensive scheme between runs. None disables caching.
         """
         self.__folder_tmp = folder + 'tmp/'
+        self.__cache = cache
+
+    def get_candidate_scores(self):
+        """ Returns the goodness function values of the last update.
+
+        Utility method to access the per-candidate scores computed by the last call of update_scheme(...), e.g. for
+        combining them with other criteria.
+
+        Returns:
+            A dictionary with the comprehensive scheme indices of the candidates ('indices'), their resolution scores
+            ('resolution') and their gradient scores ('gradient') as arrays of equal length. None before the first
+            update. The gradient score is equal for all candidates (see sensitivityUtil.compute_goodness(...)). In the
+            streamed candidate selection (see max_memory_mb), only the candidates kept for the selection are returned,
+            ordered by descending resolution score: the best candidates passing the linear independence screening, or
+            in li_mode 'greedy' the best streaming_pool_factor times the count of configurations to add.
+        """
+        return self.__candidate_scores
+
+    def get_update_stats(self):
+        """ Returns statistics of the last update.
+
+        Returns:
+            A dictionary with the count of added configurations ('added_count'), the mean resolution matrix diagonal
+            after the update ('mean_resolution') and its gain by the update ('resolution_gain'). None before the first
+            update.
+        """
+        return self.__update_stats
+
+    def reset_factorization(self):
+        """ Discards the kept factorization of the base Jacobian, so the next update factorizes it anew. """
+        self.__base_basis = None
+        self.__base_model = None
+
+    def select_configs(self, scheme_base: pb.DataContainerERT, scheme_compr: pb.DataContainerERT, j_base: np.ndarray,
+                       j_compr: np.ndarray, j_compr_indices: np.ndarray, mesh: pg.Mesh, cell_data: pg.RVector,
+                       iteration_subdir=''):
+        """ Selects the configurations to be added based on precomputed Jacobians.
+
+        Runs the candidate selection of update_scheme(...) (see __compute_next_configs(...)) without computing the
+        comprehensive Jacobian, e.g. for benchmarks or externally computed sensitivities.
+
+        Parameter:
+            scheme_base: Scheme containing already used electrode configurations.
+            scheme_compr: Scheme containing all possible electrode configurations.
+            j_base: Jacobian matrix for scheme_base.
+            j_compr: Jacobian matrix (or JacobianStore) for the valid configurations of scheme_compr.
+            j_compr_indices: The scheme_compr indices of the rows of j_compr.
+            mesh: Subsurface mesh for which the resistivities were computed.
+            cell_data: Mesh cell resistivities for gradient computations.
+            iteration_subdir: (optional) Subfolder to save files for debugging and testing purposes.
+
+        Returns:
+            The indices of the electrode configurations of scheme_compr to be added.
+        """
+        return self.__compute_next_configs(scheme_base=scheme_base, scheme_compr=scheme_compr, j_base=j_base,
+                                           j_compr=j_compr, j_compr_indices=j_compr_indices, mesh=mesh,
+                                           cell_data=cell_data, iteration_subdir=iteration_subdir)
+
+    def get_settings(self):
+        """ Returns the updater parameters which are not taken from the InversionConfiguration.
+
+        The parameters can be passed as keyword arguments to create an updater with the same selection algorithm, e.g.
+        with SweepRunner.create_resolution_updater(config, **settings) when a job is resumed.
+
+        Returns:
+            A dictionary of JSON serializable parameters (the Jacobian store data type is given by its name).
+        """
+        store_dtype = self.__jacobian_store_dtype
+        return {'resolution_rcond': self.__resolution_rcond, 'resolution_damping': self.__resolution_damping,
+                'resolution_rank': self.__resolution_rank, 'refactor_tolerance': self.__refactor_tolerance,
+                'li_mode': self.__li_mode, 'max_geometric_factor': self.__max_geometric_factor,
+                'jacobian_workers': self.__jacobian_workers, 'jacobian_chunk_size': self.__jacobian_chunk_size,
+                'jacobian_store_dtype': None if store_dtype is None else np.dtype(store_dtype).name,
+                'max_memory_mb': self.__max_memory_mb, 'streaming_pool_factor': self.__streaming_pool_factor}
+
+    def get_state(self):
+        """ Returns the state needed to continue an interrupted job.
+
+        The state contains the iteration count, the comprehensive scheme, the base factorization and the results of the
+        last update, so a resumed job neither recreates the comprehensive scheme nor refactorizes the base Jacobian.
+        The updater parameters (see get_settings()) are stored as well, so the job can be resumed with the same
+        selection algorithm.
+
+        Returns:
+            A dictionary with JSON serializable values ('values'), numpy arrays ('arrays') and schemes ('schemes').
+        """
+        state = {'values': {'iteration': self.__iteration, 'update_stats': self.__update_stats,
+                            'settings': self.get_settings()}, 'arrays': {}, 'schemes': {}}
+        if self.__comp_scheme is not None:
+            state['schemes']['comp_scheme'] = self.__comp_scheme
+        if self.__base_basis is not None:
+            state['arrays']['base_basis'] = self.__base_basis
+            state['arrays']['base_model'] = self.__base_model
+        if self.__candidate_scores is not None:
+            for name, scores in self.__candidate_scores.items():
+                state['arrays']['candidate_' + name] = scores
+        return state
+
+    def set_state(self, state: dict):
+        """ Restores a state returned by get_state().
+
+        Parameter:
+            state: The state to be restored.
+        """
+        settings = state['values'].get('settings')
+        if settings is not None and settings != json.loads(json.dumps(self.get_settings())):
+            logging.error('Updater parameters differ from the checkpointed ones! Checkpointed: ' + str(settings) +
+                          ', given: ' + str(self.get_settings()))
+        self.__iteration = state['values']['iteration']
+        self.__update_stats = state['values']['update_stats']
+        self.__comp_scheme = state['schemes'].get('comp_scheme')
+        self.__base_basis = state['arrays'].get('base_basis')
+        self.__base_model = state['arrays'].get('base_model')
+        self.__candidate_scores = None
+        if 'candidate_indices' in state['arrays']:
+            self.__candidate_scores = {name: state['arrays']['candidate_' + name]
+                                       for name in ['indices', 'resolution', 'gradient']}
 
     def __create_comprehensive_scheme(self):
         """ Creates a scheme containing most conventional electrode configurations.
@@ -66,8 +238,9 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
         schemes = self.__base_configs + self.__add_configs
         # Compute needed electrode information
         electrode_counts = [np.ceil((self.__world_x - 2 * self.__electrode_offset)/ self.__spacing) + 1]
-        comp_electrodes = [pg.utils.grange(start=self.__electrode_offset, end=self.__world_x - self.__electrode_offset,
-                                           n=electrode_counts[0])]
+        electrodes = np.array(pg.utils.grange(start=self.__electrode_offset,
+                                              end=self.__world_x - self.__electrode_offset, n=electrode_counts[0]))
+        thinning_factors = [1]
         # Compute electrode counts for virtually thinned-out configurations
         for k in range(2,int(np.floor(electrode_counts[0]))):
             j = 0
@@ -75,28 +248,21 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
                 if (electrode_counts[j]-1)/k+1 > 4 and (electrode_counts[j]-1)/k+1 not in electrode_counts:
                     electrode_counts.append((electrode_counts[j]-1)/k+1)
                     j = len(electrode_counts) - 1
-                    comp_electrodes.append(pg.utils.grange(start=self.__electrode_offset,
-                                                           end=self.__world_x - self.__electrode_offset,
-                                                           n=electrode_counts[j]))
+                    # Thinned-out electrodes are every n-th electrode of the full set
+                    thinning_factors.append(int(round((electrode_counts[0] - 1) / (electrode_counts[j] - 1))))
                 else:
                     electrode_counts.append((electrode_counts[j] - 1) / k + 1)
                     j = len(electrode_counts) - 1
-        # Create initial scheme for all selected electrode counts
-        logging.info('Create scheme with configuration: ' + schemes[0])
-        self.__comp_scheme = pb.createData(elecs=comp_electrodes[0], schemeName=schemes[0])
-        for j in range(1,len(comp_electrodes)):
-            scheme_tmp = pb.createData(elecs=comp_electrodes[j], schemeName=schemes[0])
-            self.__comp_scheme = schemeUtil.merge_schemes(scheme1=self.__comp_scheme, scheme2=scheme_tmp,
-                                                          tmp_dir=self.__folder_tmp)
-        # Merge all selected schemes for all selected electrode counts
-        for i in range(1,len(schemes)-1):
-            scheme_tmp = pb.createData(elecs=comp_electrodes[0], schemeName=schemes[i])
-            for j in range(1, len(comp_electrodes)):
-                scheme_tmp2 = pb.createData(elecs=comp_electrodes[j], schemeName=schemes[i])
-                scheme_tmp = schemeUtil.merge_schemes(scheme1=scheme_tmp, scheme2=scheme_tmp2, tmp_dir=self.__folder_tmp)
-            logging.info('Merging with configuration: ' + schemes[i])
-            self.__comp_scheme = schemeUtil.merge_schemes(scheme1=self.__comp_scheme, scheme2=scheme_tmp,
-                                                          tmp_dir=self.__folder_tmp)
+        # Create configurations of all selected schemes for all selected electrode counts
+        if self.__cache is not None:
+            key = ArtifactCache.fingerprint('comprehensive_scheme', schemes, thinning_factors, electrodes)
+            self.__comp_scheme = self.__cache.load_scheme(key)
+            if self.__comp_scheme is not None:
+                return
+        self.__comp_scheme = schemeUtil.create_comprehensive_scheme(electrodes=electrodes, scheme_names=schemes,
+                                                                    thinning_factors=thinning_factors)
+        if self.__cache is not None:
+            self.__cache.save_scheme(key, self.__comp_scheme)
 
     def __compute_jacobian(self, mesh: pg.Mesh, res: np.ndarray, scheme: pb.DataContainerERT):
         """ Computes the Jacobian (sensitivity) matrix.
@@ -109,51 +275,117 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
             scheme: The electrode configuration scheme for sensitivity calculation
 
         Returns:
-            The Jacobian matrix as numpy matrix
+            The Jacobian matrix (as numpy matrix or JacobianStore) and the scheme indices of its rows.
         """
-        ert = pb.ERTManager()
-        # Simulate data for brute-force sensitivity calculation
-        logging.info('Simulating data...')
-        data = ert.simulate(mesh=mesh, res=res, scheme=scheme, verbose=False, noiseLevel=0, noiseAbs=0)
-        data.markInvalid(data('rhoa') < 0)
-        data.removeInvalid()
-        # Set essential data for Jacobian computation
-        ert = pb.ERTManager()
-        ert.setMesh(mesh, omitBackground=True)
-        ert.setData(data)
-        # Compute Jacobian matrix
-        logging.info('Create Jacobian...')
-        ert.fop.createJacobian(res)
-        return pg.utils.base.gmat2numpy(ert.fop.jacobian())
-
-    def __compute_inner_products(self, j_base: np.ndarray, j_add: np.ndarray, k: int, nm: int):
-        """ Computes the inner products of possible configurations to add.
-
-        Method to compute the inner products of configuration sensitivities of possibly added configurations and
-        already used configurations.
+        return jacobianUtil.compute_jacobian(mesh=mesh, res=res, scheme=scheme,
+                                             max_geometric_factor=self.__max_geometric_factor,
+                                             workers=self.__jacobian_workers, chunk_size=self.__jacobian_chunk_size,
+                                             tmp_dir=self.__folder_tmp, store_dtype=self.__jacobian_store_dtype)
+
+    def __compute_base_resolution(self, j_base: np.ndarray, model: pg.RVector):
+        """ Computes the resolution matrix diagonal of the configurations in use.
+
+        Method that keeps an orthonormal basis of the base Jacobian row space between iterations. The basis is extended
+        by the configurations added in __compute_next_configs(...) and only recomputed from j_base when the inversion
+        model changed by more than the refactorization tolerance (or the mesh changed). Damped resolutions are always
+        computed from j_base.
 
         Parameter:
-            j_base: Sensitivities of configurations already in use.
-            j_add: Sensitivities of configurations not in use.
-            k: Index of configuration to be checked.
-            nm: Mesh cell count.
+            j_base: Jacobian matrix for the configurations in use.
+            model: Mesh cell resistivities the Jacobian was computed for.
 
         Returns:
-            Vector containing the computed linear dependencies (0 -> fully independent, 1 -> fully dependent)
+            The resolution matrix diagonal with one entry per mesh cell.
         """
-        n_base = len(j_base)
-        li = np.zeros(n_base)
-        # Compute inner products using every base configuration and every cell
-        for i in range(n_base):
-            for j in range(nm):
-                li[i] += j_base[i][j] * j_add[k][j]
-            li[i] /= (np.linalg.norm(j_base[i]) * np.linalg.norm(j_add[k]))
-            li[i] = np.abs(li[i])
-        return li
+        if self.__resolution_damping > 0:
+            return sensitivityUtil.compute_resolution_diagonal(jacobian=j_base, rcond=self.__resolution_rcond,
+                                                               damping=self.__resolution_damping)
+        log_model = np.log(np.asarray(model))
+        if self.__base_basis is not None and len(log_model) == len(self.__base_model):
+            model_change = np.linalg.norm(log_model - self.__base_model) / np.linalg.norm(self.__base_model)
+            if model_change <= self.__refactor_tolerance:
+                logging.info('Reusing base factorization (model change: %f, rank: %d)', model_change,
+                             self.__base_basis.shape[1])
+                return sensitivityUtil.compute_resolution_diagonal_from_basis(basis=self.__base_basis)
+        logging.info('Factorizing base Jacobian...')
+        self.__base_basis = sensitivityUtil.compute_row_space_basis(jacobian=j_base, rcond=self.__resolution_rcond)
+        self.__base_model = log_model
+        return sensitivityUtil.compute_resolution_diagonal_from_basis(basis=self.__base_basis)
+
+    def __extend_base(self, j_base: np.ndarray, r_base_diag: np.ndarray, rows: np.ndarray):
+        """ Extends the base factorization by the added configurations and records the resolution gain.
+
+        Parameter:
+            j_base: Jacobian matrix for the configurations in use.
+            r_base_diag: The resolution matrix diagonal of j_base.
+            rows: The Jacobian rows of the added configurations.
+        """
+        r_new_diag = r_base_diag
+        if len(rows) > 0:
+            if self.__base_basis is not None:
+                self.__base_basis = sensitivityUtil.append_to_row_space_basis(basis=self.__base_basis, rows=rows)
+                r_new_diag = sensitivityUtil.compute_resolution_diagonal_from_basis(basis=self.__base_basis)
+            else:
+                r_new_diag = sensitivityUtil.compute_resolution_diagonal(jacobian=np.vstack([j_base, rows]),
+                                                                         rcond=self.__resolution_rcond,
+                                                                         damping=self.__resolution_damping)
+        resolution_gain = float(np.mean(r_new_diag) - np.mean(r_base_diag))
+        logging.info('Mean resolution gain of the update: %f', resolution_gain)
+        self.__update_stats = {'added_count': len(rows), 'mean_resolution': float(np.mean(r_new_diag)),
+                               'resolution_gain': resolution_gain}
+
+    def __compute_gradient(self, mesh: pg.Mesh, cell_data: pg.RVector, iteration_subdir: str):
+        """ Computes the normalized resistivity gradient of every mesh cell.
+
+        Parameter:
+            mesh: Subsurface mesh for which the resistivities were computed.
+            cell_data: Mesh cell resistivities.
+            iteration_subdir: Subfolder to save files for debugging and testing purposes.
+
+        Returns:
+            The gradient per mesh cell (zeros when the gradient weight is 0).
+        """
+        grad = np.zeros(mesh.cellCount())
+        if self.__gradient_weight > 0:
+            pairs, distances = self.__get_adjacency(mesh)
+            grad = meshUtil.compute_cell_gradient(cell_data=np.asarray(cell_data), pairs=pairs, distances=distances)
+            grad /= max(grad)
+            outpath = self.__folder_tmp + '../' + iteration_subdir + 'gradient.dat'
+            logging.info('Saving resistivity and resolution data to: ' + outpath)
+            cell_centers = meshUtil.get_cell_centers(mesh)
+            np.savetxt(outpath, np.column_stack([cell_centers[:, 0], cell_centers[:, 1], cell_data, grad]), fmt='%f',
+                       header='x z rho grad', comments='')
+        return grad
+
+    def __get_adjacency(self, mesh: pg.Mesh):
+        """ Returns the adjacency index of a mesh.
+
+        The adjacency index (see meshUtil.compute_cell_adjacency(...)) is computed once per mesh geometry and kept for
+        the following iterations. With a cache, it is also reused between runs.
+
+        Parameter:
+            mesh: The mesh to be indexed.
+
+        Returns:
+            The cell index pairs of neighbouring cells and their center distances.
+        """
+        key = ArtifactCache.fingerprint('adjacency', meshUtil.get_cell_centers(mesh))
+        if self.__adjacency is not None and self.__adjacency[0] == key:
+            return self.__adjacency[1], self.__adjacency[2]
+        arrays = None if self.__cache is None else self.__cache.load_arrays(key)
+        if arrays is None:
+            logging.info('Computing mesh adjacency...')
+            pairs, distances = meshUtil.compute_cell_adjacency(mesh)
+            if self.__cache is not None:
+                self.__cache.save_arrays(key, {'pairs': pairs, 'distances': distances})
+        else:
+            pairs, distances = arrays['pairs'], arrays['distances']
+        self.__adjacency = (key, pairs, distances)
+        return pairs, distances
 
     def __compute_next_configs(self, scheme_base: pb.DataContainerERT, scheme_compr: pb.DataContainerERT,
-                               j_base: np.ndarray, j_compr: np.ndarray, mesh: pg.Mesh, cell_data: pg.RVector,
-                               iteration_subdir: str):
+                               j_base: np.ndarray, j_compr: np.ndarray, j_compr_indices: np.ndarray, mesh: pg.Mesh,
+                               cell_data: pg.RVector, iteration_subdir: str):
         """ Computes the additional electrode configurations.
 
         Method that computes the electrode configurations which are the next most optimal based on subsurface resolution
@@ -163,7 +395,8 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
             scheme_base: Scheme containing already used electrode configurations.
             scheme_compr: Scheme containing all possible electrode configurations.
             j_base: Jacobian matrix for scheme_base.
-            j_compr: Jacobian matrix for scheme_compr.
+            j_compr: Jacobian matrix (or JacobianStore) for the valid configurations of scheme_compr.
+            j_compr_indices: The scheme_compr indices of the rows of j_compr.
             mesh: Subsurface mesh for which the resistivities were computed.
             cell_data: Mesh cell resistivities for gradient computations.
             iteration_subdir: Subfolder to save files for debugging and testing purposes.
@@ -174,82 +407,191 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
         electrode_count = len(scheme_compr.sensorPositions())
         nm = len(j_base[0]) # cell count
         nd = int(electrode_count * (electrode_count-1) * (electrode_count-2) * (electrode_count-3) / 8)
-        nd2 = len(j_compr)  # count of comprehensive configurations
         # Compute j_add by subtracting j_base from j_compr
-        duplicate_indices = schemeUtil.find_duplicate_configurations(scheme1=scheme_compr, scheme2=scheme_base)
-        j_add = np.delete(arr=j_compr,obj=duplicate_indices,axis=0)
-        j_add_idx_dict = np.delete(arr=range(nd2),obj=duplicate_indices)
-        # Compute resolution matrices
-        j_compr_inv = np.linalg.pinv(j_compr)
-        r_compr = np.matmul(j_compr_inv, j_compr)
-        j_base_inv = np.linalg.pinv(j_base)
-        r_base = np.matmul(j_base_inv, j_base)
+        duplicate_indices, _ = schemeUtil.find_duplicate_configurations(scheme1=scheme_compr, scheme2=scheme_base)
+        add_rows = np.nonzero(np.logical_not(np.isin(j_compr_indices, duplicate_indices)))[0]
+        if isinstance(j_compr, JacobianStore):
+            j_add = j_compr.rows(add_rows)
+        else:
+            j_add = j_compr[add_rows]
+        j_add_idx_dict = j_compr_indices[add_rows]
+        # Compute resolution matrix diagonals
+        with metricsUtil.stage('resolution', nd=len(j_compr), nm=nm):
+            r_compr_diag = sensitivityUtil.compute_resolution_diagonal(jacobian=j_compr, rcond=self.__resolution_rcond,
+                                                                       damping=self.__resolution_damping,
+                                                                       rank=self.__resolution_rank)
+            r_base_diag = self.__compute_base_resolution(j_base=j_base, model=cell_data)
         # Compute weighting vector
-        gj_sum = np.zeros(nm)
-        for i in range(nm):
-            for j in range(nd2):
-                gj_sum[i] += np.abs(j_compr[j,i])
-            gj_sum[i] /= nd
+        gj_sum = sensitivityUtil.compute_weighting_vector(j_compr=j_compr, nd=nd)
         # Compute gradient weighting
-        grad = np.zeros(nm)
-        if self.__gradient_weight > 0:
-            mesh.createNeighbourInfos()
-            cc = mesh.cellCenters()
-            for i in range(nm):
-                n = 0
-                cell_grad = 0
-                for j in range(mesh.cells()[i].neighbourCellCount()):
-                    if mesh.cells()[i].neighbourCell(j) is not None:
-                        n += 1
-                        i_n = mesh.cells().index((mesh.cells()[i].neighbourCell(j)))
-                        cell_grad += np.abs(cell_data[i] - cell_data[i_n]) / \
-                                     ((cc[i][0] - cc[i_n][0]) ** 2 + (cc[i][1] - cc[i_n][1]) ** 2) ** 0.5
-                grad[i] = cell_grad / n
-            grad /= max(grad)
-            outpath = self.__folder_tmp + '../' + iteration_subdir + 'gradient.dat'
-            logging.info('Saving resistivity and resolution data to: ' + outpath)
-            with open(outpath, 'w') as f:
-                cell_centers = mesh.cellCenters()
-                f.write('x z rho grad\n')
-                for i in range(len(cell_data)):
-                    f.write('%f %f %f %f\n' % (cell_centers[i][0],cell_centers[i][1],cell_data[i],grad[i]))
-                f.close()
+        grad = self.__compute_gradient(mesh=mesh, cell_data=cell_data, iteration_subdir=iteration_subdir)
         # Compute goodness function
-        res_gf = np.zeros(len(j_add))
-        grad_gf = np.zeros(len(j_add))
-        for i in range(len(j_add)):
-            for j in range(nm):
-                res_gf[i] += np.abs(j_add[i, j]) / gj_sum[j] * (1 - r_base[j, j] / r_compr[j, j])
-                grad_gf[i] += grad[j]
+        with metricsUtil.stage('goodness', nd=len(j_add), nm=nm):
+            res_gf, grad_gf = sensitivityUtil.compute_goodness(j_add=j_add, gj_sum=gj_sum, r_base_diag=r_base_diag,
+                                                               r_compr_diag=r_compr_diag, grad=grad)
+        self.__candidate_scores = {'indices': j_add_idx_dict, 'resolution': res_gf, 'gradient': grad_gf}
         # Create array with joint configuration suggestions
         sorted_indices_res = np.flip(np.argsort(res_gf))
         sorted_indices_grad = np.flip(np.argsort(grad_gf))
         grad_count = int(np.floor(self.__addconfig_count*self.__gradient_weight))
         res_count = self.__addconfig_count - grad_count
-        indices_to_use = []
-        added_indices = 0
-        idx_rank = 0
-        while added_indices < res_count:
-            if idx_rank >= len(sorted_indices_res):
-                break
-            idx_to_add = sorted_indices_res[idx_rank]
-            li = self.__compute_inner_products(j_base=j_base, j_add=j_add, k=idx_to_add, nm=nm)
-            li_accepted = True
-            for i in range(len(li)):
-                if li[i] >= self.__li_threshold:
-                    li_accepted = False
-            if li_accepted:
-                indices_to_use.append(j_add_idx_dict[idx_to_add])
-                added_indices += 1
-            idx_rank += 1
-        logging.info('LI: Skipping %d configurations', idx_rank - res_count)
+        with metricsUtil.stage('li_screening', nd=len(j_add), nm=nm) as record:
+            if self.__li_mode == 'greedy':
+                basis = self.__base_basis
+                if basis is None:
+                    basis = sensitivityUtil.compute_row_space_basis(jacobian=j_base, rcond=self.__resolution_rcond)
+                accepted, checked, _ = sensitivityUtil.select_greedy_orthogonal(basis=basis, j_add=j_add,
+                                                                                candidate_order=sorted_indices_res,
+                                                                                li_threshold=self.__li_threshold,
+                                                                                max_count=res_count)
+            else:
+                accepted, checked = sensitivityUtil.screen_linear_independence(j_base=j_base, j_add=j_add,
+                                                                               candidate_order=sorted_indices_res,
+                                                                               li_threshold=self.__li_threshold,
+                                                                               max_count=res_count)
+            record['checked'] = checked
+        indices_to_use = list(j_add_idx_dict[accepted])
+        added_indices = len(accepted)
+        logging.info('LI: Skipping %d configurations', checked - added_indices)
         if grad_count > 0:
             grad_count += res_count - added_indices
             if len(sorted_indices_grad) > grad_count:
                 indices_to_use = indices_to_use + list(j_add_idx_dict[sorted_indices_grad[0:grad_count]])
             else:
                 indices_to_use = indices_to_use + list(j_add_idx_dict[sorted_indices_grad])
-        return np.unique(indices_to_use)
+        indices_to_use = np.unique(indices_to_use)
+        # Extend base factorization by the added configurations
+        added_rows = np.searchsorted(j_add_idx_dict, indices_to_use)
+        self.__extend_base(j_base=j_base, r_base_diag=r_base_diag,
+                           rows=j_add[added_rows] if len(added_rows) > 0 else np.zeros((0, nm)))
+        return indices_to_use
+
+    def __compute_next_configs_streaming(self, scheme_base: pb.DataContainerERT, scheme_compr: pb.DataContainerERT,
+                                         j_base: np.ndarray, mesh: pg.Mesh, cell_data: pg.RVector,
+                                         iteration_subdir: str):
+        """ Computes the additional electrode configurations with bounded memory.
+
+        Method that selects the same configurations as __compute_next_configs(...) (for the 'base' li mode) without
+        holding the comprehensive Jacobian in memory. The Jacobian is computed in chunks sized by the memory budget.
+        Every block is persisted to a JacobianStore and screened against the base configurations right away while the
+        weighting vector is accumulated. The resolution is computed from row blocks of the same size, only its nm x nm
+        triangular factor (nm: cell count) is held in addition to the budget. A second pass over the stored candidates
+        scores them and keeps only a running top-k heap. For the 'greedy' li mode, the heap keeps streaming_pool_factor
+        times more candidates which are then selected greedily.
+
+        Parameter:
+            scheme_base: Scheme containing already used electrode configurations.
+            scheme_compr: Scheme containing all possible electrode configurations.
+            j_base: Jacobian matrix for scheme_base.
+            mesh: Subsurface mesh for which the resistivities were computed.
+            cell_data: Mesh cell resistivities for gradient and Jacobian computations.
+            iteration_subdir: Subfolder to save files for debugging and testing purposes.
+
+        Returns:
+            The indices of the electrode configurations to be added to the measurement scheme.
+        """
+        electrode_count = len(scheme_compr.sensorPositions())
+        nm = len(j_base[0]) # cell count
+        nd = int(electrode_count * (electrode_count-1) * (electrode_count-2) * (electrode_count-3) / 8)
+        grad_count = int(np.floor(self.__addconfig_count*self.__gradient_weight))
+        res_count = self.__addconfig_count - grad_count
+        duplicate_indices, _ = schemeUtil.find_duplicate_configurations(scheme1=scheme_compr, scheme2=scheme_base)
+        valid_indices, k = jacobianUtil.find_valid_configurations(scheme=scheme_compr,
+                                                                  max_geometric_factor=self.__max_geometric_factor)
+        # Every worker holds its chunk twice (pybert and numpy), the main process one block and its products
+        workers = max(self.__jacobian_workers, 1)
+        chunk_size = max(int(self.__max_memory_mb * 2 ** 20 / (3 * 8 * nm * (workers + 1))), 1)
+        logging.info('Streaming Jacobian in chunks of %d configurations...', chunk_size)
+        store_dtype = np.float64 if self.__jacobian_store_dtype is None else self.__jacobian_store_dtype
+        store = JacobianStore(folder=self.__folder_tmp, n_rows=len(valid_indices), n_cols=nm, dtype=store_dtype)
+        blocks = jacobianUtil.iter_jacobian_blocks(mesh=mesh, res=cell_data, scheme=scheme_compr,
+                                                   valid_indices=valid_indices, k=k, workers=workers,
+                                                   chunk_size=chunk_size, tmp_dir=self.__folder_tmp)
+        try:
+            # First pass: compute, persist and screen Jacobian blocks
+            j_base_norm = sensitivityUtil.normalize_rows(j_base)
+            gj_sum = np.zeros(nm)
+            add_rows = []
+            li_accepted = []
+            start = 0
+            with metricsUtil.stage('compute_jacobian', nd=len(valid_indices), nm=nm, electrodes=electrode_count,
+                                   chunk_size=chunk_size):
+                for indices, block in blocks:
+                    store.write_rows(start=start, rows=block)
+                    gj_sum += np.sum(np.abs(block), axis=0)
+                    candidates = np.logical_not(np.isin(indices, duplicate_indices))
+                    add_rows.append(start + np.nonzero(candidates)[0])
+                    if self.__li_mode == 'greedy':
+                        li_accepted.append(candidates[candidates])
+                    else:
+                        # Screened per block, so this stage is recorded once per Jacobian block
+                        with metricsUtil.stage('li_screening', nd=int(np.count_nonzero(candidates)), nm=nm):
+                            li = sensitivityUtil.compute_max_li(j_base_norm=j_base_norm, rows=block[candidates])
+                            li_accepted.append(li < self.__li_threshold)
+                    start += len(block)
+                store.flush()
+            gj_sum /= nd
+            add_rows = np.concatenate(add_rows).astype(int)
+            li_accepted = np.concatenate(li_accepted).astype(bool)
+            # Compute resolution matrix diagonals and gradient weighting
+            with metricsUtil.stage('resolution', nd=len(valid_indices), nm=nm):
+                r_compr_diag = sensitivityUtil.compute_resolution_diagonal(
+                    jacobian=store, rcond=self.__resolution_rcond, damping=self.__resolution_damping,
+                    rank=self.__resolution_rank, block_size=chunk_size)
+                r_base_diag = self.__compute_base_resolution(j_base=j_base, model=cell_data)
+            grad = self.__compute_gradient(mesh=mesh, cell_data=cell_data, iteration_subdir=iteration_subdir)
+            # Second pass: score the candidates and keep the best ones
+            pool_size = res_count
+            if self.__li_mode == 'greedy':
+                pool_size = res_count * self.__streaming_pool_factor
+            res_heap = []
+            grad_heap = []
+            j_add = store.rows(add_rows)
+            block_size = chunk_size
+            with metricsUtil.stage('goodness', nd=len(add_rows), nm=nm):
+                for block_start in range(0, len(add_rows), block_size):
+                    block_rows = add_rows[block_start:block_start + block_size]
+                    block_accepted = li_accepted[block_start:block_start + block_size]
+                    res_gf, grad_gf = sensitivityUtil.compute_goodness(
+                        j_add=j_add[block_start:block_start + block_size], gj_sum=gj_sum, r_base_diag=r_base_diag,
+                        r_compr_diag=r_compr_diag, grad=grad)
+                    sensitivityUtil.update_top_candidates(heap=res_heap, scores=res_gf[block_accepted],
+                                                          indices=block_rows[block_accepted], count=pool_size)
+                    sensitivityUtil.update_top_candidates(heap=grad_heap, scores=grad_gf, indices=block_rows,
+                                                          count=self.__addconfig_count)
+            res_ranking = sorted(res_heap, reverse=True)
+            ranked_rows = np.array([row for _, row in res_ranking], dtype=int)
+            self.__candidate_scores = {'indices': valid_indices[ranked_rows],
+                                       'resolution': np.array([score for score, _ in res_ranking]),
+                                       'gradient': np.full(len(ranked_rows), np.sum(grad))}
+            # Select configurations
+            if self.__li_mode == 'greedy':
+                with metricsUtil.stage('li_screening', nd=len(ranked_rows), nm=nm) as record:
+                    basis = self.__base_basis
+                    if basis is None:
+                        basis = sensitivityUtil.compute_row_space_basis(jacobian=j_base, rcond=self.__resolution_rcond)
+                    accepted, checked, _ = sensitivityUtil.select_greedy_orthogonal(
+                        basis=basis, j_add=store.rows(ranked_rows), candidate_order=range(len(ranked_rows)),
+                        li_threshold=self.__li_threshold, max_count=res_count)
+                    record['checked'] = checked
+                selected_rows = list(ranked_rows[accepted])
+                logging.info('LI: Skipping %d configurations', checked - len(accepted))
+            else:
+                selected_rows = list(ranked_rows[0:res_count])
+                logging.info('LI: Skipping %d configurations', np.count_nonzero(np.logical_not(li_accepted)))
+            if grad_count > 0:
+                grad_count += res_count - len(selected_rows)
+                grad_ranking = sorted(grad_heap, reverse=True)
+                selected_rows = selected_rows + [row for _, row in grad_ranking[0:grad_count]]
+            selected_rows = np.unique(selected_rows).astype(int)
+            # Extend base factorization by the added configurations
+            self.__extend_base(j_base=j_base, r_base_diag=r_base_diag,
+                               rows=store[selected_rows] if len(selected_rows) > 0 else np.zeros((0, nm)))
+            return valid_indices[selected_rows]
+        finally:
+            # Remove the Jacobian file and the worker mesh file, also when the update failed
+            blocks.close()
+            store.close()
 
     def init_scheme(self):
         """ Creates the initial measurement scheme.
@@ -272,7 +614,7 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
         scheme = pb.createData(elecs=electrodes, schemeName=self.__base_configs[0])
         for i in range(1, len(self.__base_configs)):
             scheme_tmp = pb.createData(elecs=electrodes, schemeName=self.__base_configs[i])
-            scheme = schemeUtil.merge_schemes(scheme1=scheme, scheme2=scheme_tmp, tmp_dir=self.__folder_tmp)
+            scheme = schemeUtil.merge_schemes(scheme1=scheme, scheme2=scheme_tmp)
         return scheme
 
     def update_scheme(self, old_scheme: pb.DataContainerERT, fop: pb.DCSRMultiElectrodeModelling, inv_grid: pg.Mesh,
@@ -295,15 +637,34 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
         self.__iteration = self.__iteration + 1
         # Create comprehensive scheme on first iteration
         if self.__comp_scheme == None:
-            self.__create_comprehensive_scheme()
+            with metricsUtil.stage('create_comprehensive_scheme') as record:
+                self.__create_comprehensive_scheme()
+                record['nd'] = self.__comp_scheme.size()
         # Compute next electrode configurations
-        logging.info('Computing Jacobian for comprehensive scheme...')
-        j_compr = self.__compute_jacobian(mesh=inv_grid, res=inv_result, scheme=self.__comp_scheme)
-        logging.info('Computing goodness function...')
-        config_indices = self.__compute_next_configs(scheme_base=old_scheme, scheme_compr=self.__comp_scheme,
-                                                     j_base=pg.utils.base.gmat2numpy(fop.jacobian()), j_compr=j_compr,
-                                                     mesh=inv_grid, cell_data=inv_result,
-                                                     iteration_subdir=iteration_subdir)
+        j_base = pg.utils.base.gmat2numpy(fop.jacobian())
+        if self.__max_memory_mb is not None:
+            logging.info('Computing goodness function with streamed Jacobian...')
+            with metricsUtil.stage('compute_next_configs_streaming', nd=self.__comp_scheme.size(),
+                                   nm=inv_grid.cellCount()):
+                config_indices = self.__compute_next_configs_streaming(scheme_base=old_scheme,
+                                                                       scheme_compr=self.__comp_scheme, j_base=j_base,
+                                                                       mesh=inv_grid, cell_data=inv_result,
+                                                                       iteration_subdir=iteration_subdir)
+        else:
+            logging.info('Computing Jacobian for comprehensive scheme...')
+            with metricsUtil.stage('compute_jacobian', nd=self.__comp_scheme.size(), nm=inv_grid.cellCount(),
+                                   electrodes=len(self.__comp_scheme.sensorPositions())):
+                j_compr, j_compr_indices = self.__compute_jacobian(mesh=inv_grid, res=inv_result,
+                                                                   scheme=self.__comp_scheme)
+            logging.info('Computing goodness function...')
+            try:
+                config_indices = self.__compute_next_configs(scheme_base=old_scheme, scheme_compr=self.__comp_scheme,
+                                                             j_base=j_base, j_compr=j_compr,
+                                                             j_compr_indices=j_compr_indices, mesh=inv_grid,
+                                                             cell_data=inv_result, iteration_subdir=iteration_subdir)
+            finally:
+                if isinstance(j_compr, JacobianStore):
+                    j_compr.close()
         # Save added configurations to file
         outpath = self.__folder_tmp + '../' + iteration_subdir + 'configs_to_add.txt'
         logging.info('Saving computed configs to: ' + outpath)
@@ -313,5 +674,6 @@ class ResolutionElectrodeUpdater(ElectrodeUpdater):
             f.close()
         # Add new configurations to original scheme
         scheme_add = schemeUtil.extract_configs_from_scheme(scheme=self.__comp_scheme, config_indices=config_indices,
-                                                            tmp_dir=self.__folder_tmp)
-        return schemeUtil.merge_schemes(scheme1=old_scheme, scheme2=scheme_add, tmp_dir=self.__folder_tmp)
+                                                            view=True)
+        with metricsUtil.stage('merge_schemes', nd=old_scheme.size() + scheme_add.size()):
+            return schemeUtil.merge_schemes(scheme1=old_scheme, scheme2=scheme_add)
@@ -45,10 +45,10 @@ class StaticElectrodeUpdater(ElectrodeUpdater):
         scheme = pb.createData(elecs=electrodes, schemeName=self.__configs[0])
         for i in range(1, len(self.__configs) - 1):
             scheme_tmp = pb.createData(elecs=electrodes, schemeName=self.__configs[i])
-            scheme = schemeUtil.merge_schemes(scheme1=scheme, scheme2=scheme_tmp, tmp_dir=self.__folder_tmp)
+            scheme = schemeUtil.merge_schemes(scheme1=scheme, scheme2=scheme_tmp)
         return scheme
 
-    def set_essentials(self, folder):
+    def set_essentials(self, folder, cache=None):
         """ Sets a few parameters at runtime.
 
         Utility method for setting parameters at runtime (or after FlexibleInversionController construction) which can
@@ -56,6 +56,7 @@ class StaticElectrodeUpdater(ElectrodeUpdater):
 
         Parameter:
             folder: the folder which is used for persisting iteration-specific data
+            cache: (optional) An ArtifactCache for reusing generated artifacts between runs (unused).
         """
         self.__folder_tmp = folder + 'tmp/'
 
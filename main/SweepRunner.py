@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+import datetime
+import inspect
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+import time
+
+from main.FlexibleInversionController import FlexibleInversionController
+from main.InversionConfiguration import InversionConfiguration
+from main.ResolutionElectrodeUpdater import ResolutionElectrodeUpdater
+
+def create_resolution_updater(config: InversionConfiguration, **kwargs):
+    """ Creates a ResolutionElectrodeUpdater from an InversionConfiguration (like runnerScript.py does).
+
+    Parameter:
+        config: The configuration of the job.
+        kwargs: (optional) Further ResolutionElectrodeUpdater parameters, e.g. li_mode or jacobian_workers.
+
+    Returns:
+        The created electrode updater.
+    """
+    return ResolutionElectrodeUpdater(world_x=config.world_x, spacing=config.finv_spacing,
+                                      electrode_offset=config.world_electrode_offset,
+                                      base_configs=config.finv_base_configs, add_configs=config.finv_add_configs,
+                                      gradient_weight=config.finv_gradient_weight,
+                                      addconfig_count=config.finv_addconfig_count,
+                                      li_threshold=config.finv_li_threshold, **kwargs)
+
+def run_job(job: dict, create_updater, limits: dict, connection):
+    """ Runs a single job of a sweep. Executed in a separate process.
+
+    The job becomes the leader of a new process group, so the job can be stopped together with all processes it
+    started (e.g. the Jacobian workers). The resource limits are set per process and inherited by the started
+    processes.
+
+    Parameter:
+        job: The job description (see SweepRunner.expand_grid(...)).
+        create_updater: A module-level function creating the electrode updater from the configuration and the updater
+                        parameters of the job.
+        limits: The resource limits of the job ('max_memory_mb', 'max_cpu_s'), None entries are not limited.
+        connection: The connection the job result is sent to.
+    """
+    os.setsid()
+    if limits['max_memory_mb'] is not None:
+        max_bytes = int(limits['max_memory_mb'] * 2 ** 20)
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+    if limits['max_cpu_s'] is not None:
+        # Exceeding the soft limit sends SIGXCPU, which kills the job before it can send a result
+        max_cpu_s = int(limits['max_cpu_s'])
+        resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_s, max_cpu_s + 5))
+    result = {'status': 'failed'}
+    fic = None
+    try:
+        config = InversionConfiguration(**job['config'])
+        fic = FlexibleInversionController(config, create_updater(config, **job['updater']))
+        fic.run()
+        result.update(fic.get_result())
+        # No job folder is created for an invalid configuration
+        finished = result['folder'] is not None and os.path.isdir(result['folder'] + 'final_inv/')
+        result['status'] = 'finished' if finished else 'failed'
+    except MemoryError:
+        result['status'] = 'memory_limit'
+    except Exception as e:
+        logging.exception('Job failed')
+        result['error'] = repr(e)
+    if fic is not None and 'folder' not in result:
+        result['folder'] = fic.get_folder()
+    connection.send(result)
+    connection.close()
+
+class SweepRunner:
+    """ A class running many FlexibleInversionController jobs concurrently.
+
+    This class runs a list of jobs (e.g. created by expand_grid(...)) in a bounded set of worker processes. Every job
+    runs in its own process with its own job folder within the sweep folder, optional resource limits and an optional
+    wall time limit. All jobs share a cache directory (see ArtifactCache), so meshes and comprehensive schemes are only
+    generated once for equal settings. After all jobs ended, a summary table of the results and timings is written to
+    the sweep folder.
+
+    Parameter:
+        jobs: A list of job descriptions, each a dictionary with the 'name' of the job, the InversionConfiguration
+              parameters ('config') and further parameters for create_updater ('updater').
+        workers: (optional) An int setting the count of jobs running at the same time.
+        folder: (optional) A string setting the directory in which the sweep folder is created.
+        cache_dir: (optional) A string setting the cache directory shared by all jobs. None uses 'cache/' within the
+                   sweep folder. Jobs configuring their own general_cache_dir keep it.
+        timeout: (optional) A float setting the wall time limit per job in seconds. None disables the limit.
+        max_memory_mb: (optional) A float limiting the address space of every job process in MB. None disables the
+                       limit. The limit applies to each process of a job separately, so a job using N Jacobian workers
+                       (see ResolutionElectrodeUpdater jacobian_workers) may use up to (N + 1) times this memory.
+        max_cpu_s: (optional) A float limiting the CPU time of every job process in seconds. None disables the limit.
+                   Like max_memory_mb, it applies to each process of a job separately.
+        create_updater: (optional) A module-level function creating the electrode updater of a job from its
+                        InversionConfiguration and its 'updater' parameters.
+
+    Typical usage example:
+        jobs = SweepRunner.expand_grid(base={...}, grid={'finv_li_threshold': [0.85, 0.95]})
+        runner = SweepRunner(jobs, workers=4, timeout=3600)
+        summary = runner.run()
+    """
+    def __init__(self, jobs: list, workers=1, folder='../inversion_results/', cache_dir=None, timeout=None,
+                 max_memory_mb=None, max_cpu_s=None, create_updater=create_resolution_updater):
+        self.__jobs = jobs
+        self.__workers = max(int(workers), 1)
+        self.__base_folder = folder
+        self.__cache_dir = cache_dir
+        self.__timeout = timeout
+        self.__limits = {'max_memory_mb': max_memory_mb, 'max_cpu_s': max_cpu_s}
+        self.__create_updater = create_updater
+        self.__folder = None
+        self.__summary = []
+
+    @staticmethod
+    def expand_grid(base: dict, grid: dict, name_prefix='job'):
+        """ Creates the jobs for all combinations of the given parameter values.
+
+        Parameters of InversionConfiguration are passed to the configuration, all other parameters to create_updater.
+
+        Parameter:
+            base: The parameters shared by all jobs (all required InversionConfiguration parameters).
+            grid: A dictionary mapping parameter names to lists of values.
+            name_prefix: (optional) A string used as prefix of the job names.
+
+        Returns:
+            A list of job descriptions.
+        """
+        config_parameters = inspect.signature(InversionConfiguration.__init__).parameters
+        jobs = []
+        for i, values in enumerate(itertools.product(*grid.values())):
+            parameters = dict(base)
+            parameters.update(zip(grid.keys(), values))
+            job = {'name': '{}{:03d}'.format(name_prefix, i), 'config': {}, 'updater': {},
+                   'swept': dict(zip(grid.keys(), values))}
+            for key, value in parameters.items():
+                job['config' if key in config_parameters else 'updater'][key] = value
+            jobs.append(job)
+        return jobs
+
+    def get_folder(self):
+        """ Returns the sweep folder (None before the sweep was started). """
+        return self.__folder
+
+    def get_summary(self):
+        """ Returns the results of all finished jobs (see run()). """
+        return self.__summary
+
+    def run(self):
+        """ Runs all jobs and writes the summary table.
+
+        Returns:
+            A list with one result dictionary per job (in job order), containing the job name, the swept parameters,
+            the job status ('finished', 'failed', 'timeout', 'memory_limit', 'cpu_limit' or 'killed'), the wall time
+            and the job result (see FlexibleInversionController.get_result()).
+        """
+        self.__initialize()
+        logging.info('Running %d jobs with %d workers', len(self.__jobs), self.__workers)
+        context = multiprocessing.get_context()
+        pending = list(enumerate(self.__jobs))
+        running = []
+        results = [None] * len(self.__jobs)
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < self.__workers:
+                index, job = pending.pop(0)
+                running.append(self.__start_job(context, index, job))
+            time.sleep(0.2)
+            still_running = []
+            for entry in running:
+                result = self.__poll_job(entry)
+                if result is None:
+                    still_running.append(entry)
+                else:
+                    results[entry['index']] = result
+                    logging.info('Job %s: %s after %.1f s', result['name'], result['status'], result['wall_s'])
+            running = still_running
+        self.__summary = results
+        self.__write_summary()
+        return results
+
+    def __initialize(self):
+        """ Creates the sweep folder and prepares the job configurations. """
+        start_time = datetime.datetime.now()
+        name = self.__base_folder + 'sweep-{:%Y%m%d-%H.%M.%S}'.format(start_time)
+        folder = name
+        counter = 1
+        while True:
+            try:
+                os.makedirs(folder)
+                break
+            except FileExistsError:
+                counter += 1
+                folder = name + '-' + str(counter)
+        self.__folder = folder + '/'
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+        logging.basicConfig(format='%(asctime)s:%(levelname)s: %(message)s',
+                            filename=self.__folder + 'sweep.log', level=logging.INFO)
+        if self.__cache_dir is None:
+            self.__cache_dir = self.__folder + 'cache/'
+        with open(self.__folder + 'jobs.json', 'w') as f:
+            json.dump(self.__jobs, f, indent=2, default=str)
+
+    def __start_job(self, context, index: int, job: dict):
+        """ Starts a job process.
+
+        Parameter:
+            context: The multiprocessing context.
+            index: The index of the job.
+            job: The job description.
+
+        Returns:
+            A dictionary describing the running job.
+        """
+        job = dict(job)
+        job['config'] = dict(job['config'])
+        # Every job gets its own folder within the sweep folder, named after the job
+        job['config']['general_results_dir'] = self.__folder
+        job['config']['general_folder_suffix'] = job['config'].get('general_folder_suffix', '') + '-' + job['name']
+        if job['config'].get('general_cache_dir') is None:
+            job['config']['general_cache_dir'] = self.__cache_dir
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_job, args=(job, self.__create_updater, self.__limits, sender),
+                                  name=job['name'])
+        process.start()
+        sender.close()
+        logging.info('Job %s started (pid %d)', job['name'], process.pid)
+        return {'index': index, 'job': job, 'process': process, 'receiver': receiver, 'start': time.time(),
+                'result': None}
+
+    def __poll_job(self, entry: dict):
+        """ Checks whether a job ended or exceeded its wall time limit.
+
+        Parameter:
+            entry: The description of the running job (see __start_job(...)).
+
+        Returns:
+            The result of the job or None if the job is still running.
+        """
+        process = entry['process']
+        wall_s = time.time() - entry['start']
+        # Receive the result before joining, so the job never blocks on a full pipe
+        if entry['result'] is None and entry['receiver'].poll():
+            try:
+                entry['result'] = entry['receiver'].recv()
+            except EOFError:
+                # The job died without sending a result (e.g. killed by a signal)
+                pass
+        if process.is_alive():
+            if self.__timeout is None or wall_s <= self.__timeout:
+                return None
+            logging.info('Job %s exceeded the wall time limit, terminating', entry['job']['name'])
+            _kill_group(process.pid, signal.SIGTERM)
+            process.join(10)
+            if process.is_alive():
+                _kill_group(process.pid, signal.SIGKILL)
+                process.kill()
+                process.join()
+            result = {'status': 'timeout'}
+        else:
+            process.join()
+            result = entry['result']
+            if result is None:
+                status = 'cpu_limit' if process.exitcode == -signal.SIGXCPU else 'killed'
+                result = {'status': status, 'exitcode': process.exitcode}
+        # Stop processes the job left behind (e.g. Jacobian workers of a killed job)
+        _kill_group(process.pid, signal.SIGKILL)
+        entry['receiver'].close()
+        summary = {'name': entry['job']['name'], 'swept': entry['job'].get('swept', {}), 'wall_s': wall_s}
+        summary.update(result)
+        return summary
+
+    def __write_summary(self):
+        """ Writes the results of all jobs to summary.json and as table to summary.txt. """
+        with open(self.__folder + 'summary.json', 'w') as f:
+            json.dump(self.__summary, f, indent=2, default=str)
+        lines = ['{:<12} {:<12} {:>10} {:>10} {:>14} {:>10} {:<16} {}'.format(
+            'job', 'status', 'wall [s]', 'iterations', 'configurations', 'chi2', 'stop reason', 'parameters')]
+        for result in self.__summary:
+            lines.append('{:<12} {:<12} {:>10.1f} {:>10} {:>14} {:>10} {:<16} {}'.format(
+                result['name'], result['status'], result['wall_s'], str(result.get('iterations')),
+                str(result.get('configurations')), _format_float(result.get('chi2')),
+                str(result.get('stop_reason')), json.dumps(result['swept'], default=str)))
+        with open(self.__folder + 'summary.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        for line in lines:
+            logging.info(line)
+
+def _kill_group(pgid: int, sig: int):
+    """ Sends a signal to all processes of a job (see run_job(...)), ignoring already ended jobs. """
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _format_float(value):
+    """ Formats an optional float for the summary table. """
+    return 'None' if value is None else '{:.3f}'.format(value)
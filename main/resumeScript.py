@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+import sys
+
+from main.FlexibleInversionController import FlexibleInversionController
+from main.SweepRunner import create_resolution_updater
+
+# Folder of the interrupted job, e.g. '../inversion_results/job-2020115-10.30.0-incl/'
+job_folder = sys.argv[1]
+
+# Load inversion parameter of the job
+config = FlexibleInversionController.load_config(job_folder)
+
+# initialize electrode updater with the checkpointed parameters (its state is restored from the checkpoint)
+electrode_updater = create_resolution_updater(config, **FlexibleInversionController.load_updater_settings(job_folder))
+
+# continue synthetic optimized inversion iteration after the last completed iteration
+fic = FlexibleInversionController(config, electrode_updater)
+fic.resume(job_folder)
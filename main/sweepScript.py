@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+from main.SweepRunner import SweepRunner
+
+# Set up inversion parameter shared by all jobs
+base = dict(general_bert_verbose=False,
+            general_folder_suffix='-incl',
+            world_x=200, world_z=100, world_resistivities=[100, 10], world_gen='incl',
+            world_layers=[], world_angle=0,
+            world_inclusion_start=[20, -10], world_inclusion_dim=[5, 5],
+            world_tile_x=30, world_tile_z=5,
+            world_electrode_offset=0,
+            sim_mesh_quality=34, sim_mesh_maxarea=30, sim_noise_level=5, sim_noise_abs=1e-6,
+            inv_lambda=10, inv_dx=4, inv_dz=4, inv_depth=50,
+            inv_final_lambda=60, inv_final_dx=2, inv_final_dz=2, inv_final_depth=50,
+            finv_max_iterations=25, finv_spacing=2, finv_base_configs=['slm'],
+            finv_add_configs=['dd', 'wb', 'pp', 'pd', 'wa', 'hw', 'gr'],
+            finv_gradient_weight=0, finv_addconfig_count=50, finv_li_threshold=0.95)
+
+# Set up swept parameters (InversionConfiguration or ResolutionElectrodeUpdater parameters)
+grid = {'sim_noise_level': [1, 5],
+        'inv_lambda': [10, 30],
+        'finv_li_threshold': [0.85, 0.95],
+        'finv_addconfig_count': [25, 50]}
+
+# run all jobs, at most four at the same time
+runner = SweepRunner(SweepRunner.expand_grid(base=base, grid=grid), workers=4, timeout=6 * 3600,
+                     max_memory_mb=8192)
+runner.run()
+print('Summary saved to: ' + runner.get_folder() + 'summary.txt')
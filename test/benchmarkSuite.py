@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import pygimli as pg
+
+from main.ResolutionElectrodeUpdater import ResolutionElectrodeUpdater
+import util.schemeUtil as su
+
+# Benchmark sizes per profile. Every case is run for all combinations of its parameter lists.
+PROFILES = {
+    'quick': {
+        'merge_schemes': {'electrodes': [24, 100], 'pool': [1000, 10000]},
+        'find_duplicate_configurations': {'electrodes': [24, 100], 'pool': [1000, 10000]},
+        'extract_configs_from_scheme': {'electrodes': [24, 100], 'pool': [1000, 10000]},
+        'create_comprehensive_scheme': {'electrodes': [25, 49, 101]},
+        'compute_next_configs': {'pool': [1000, 5000], 'cells': [500, 2000]},
+    },
+    'full': {
+        'merge_schemes': {'electrodes': [24, 100, 400], 'pool': [1000, 10000, 100000]},
+        'find_duplicate_configurations': {'electrodes': [24, 100, 400], 'pool': [1000, 10000, 100000]},
+        'extract_configs_from_scheme': {'electrodes': [24, 100, 400], 'pool': [1000, 10000, 100000]},
+        'create_comprehensive_scheme': {'electrodes': [25, 49, 101, 201, 401]},
+        'compute_next_configs': {'pool': [1000, 10000, 100000], 'cells': [500, 2000, 5000, 20000]},
+    },
+}
+
+# Scheme types used for the comprehensive scheme
+SCHEME_NAMES = ['dd', 'wa', 'wb', 'slm']
+# Electrode count of the schemes used for the selection benchmark
+SELECTION_ELECTRODES = 100
+# Count of configurations in use for the selection benchmark
+SELECTION_BASE_COUNT = 200
+# Rank of the synthetic Jacobians (the remaining part is noise)
+JACOBIAN_RANK = 50
+# Reference results compared with by default, recorded with --save-baseline on the reference machine
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarkBaseline.json')
+
+def create_random_scheme(rng: np.random.Generator, electrode_count: int, size: int, spacing=1.0):
+    """ Creates a scheme of random quadrupoles on a line of electrodes.
+
+    Parameter:
+        rng: The random number generator.
+        electrode_count: The count of electrodes.
+        size: The count of configurations.
+        spacing: (optional) The distance between electrodes.
+
+    Returns:
+        The created scheme.
+    """
+    electrodes = np.column_stack([np.arange(electrode_count) * spacing, np.zeros(electrode_count),
+                                  np.zeros(electrode_count)])
+    # Draw four distinct electrodes per configuration
+    quadrupoles = np.argsort(rng.random((size, electrode_count)), axis=1)[:, 0:4]
+    columns = {token: quadrupoles[:, i] for i, token in enumerate(su.SENSOR_TOKENS)}
+    columns['k'] = rng.uniform(1, 1000, size)
+    return su.create_scheme(sensor_positions=electrodes, columns=columns)
+
+def create_overlapping_scheme(rng: np.random.Generator, scheme, electrode_count: int, overlap=0.5):
+    """ Creates a random scheme sharing a part of its configurations with a given scheme.
+
+    Parameter:
+        rng: The random number generator.
+        scheme: The scheme to share configurations with.
+        electrode_count: The count of electrodes of scheme.
+        overlap: (optional) The share of configurations taken from scheme.
+
+    Returns:
+        The created scheme.
+    """
+    shared_count = int(scheme.size() * overlap)
+    shared_indices = rng.permutation(scheme.size())[0:shared_count]
+    shared = su.extract_configs_from_scheme(scheme=scheme, config_indices=shared_indices)
+    new = create_random_scheme(rng=rng, electrode_count=electrode_count, size=scheme.size() - shared_count)
+    return su.merge_schemes(scheme1=shared, scheme2=new)
+
+def create_random_jacobian(rng: np.random.Generator, rows: int, cells: int, rank=JACOBIAN_RANK):
+    """ Creates a synthetic Jacobian of low rank with some noise.
+
+    Parameter:
+        rng: The random number generator.
+        rows: The count of configurations.
+        cells: The count of mesh cells.
+        rank: (optional) The rank of the noise-free part.
+
+    Returns:
+        The Jacobian as numpy array.
+    """
+    rank = min(rank, rows, cells)
+    jacobian = np.matmul(rng.standard_normal((rows, rank)), rng.standard_normal((rank, cells)))
+    jacobian += 0.01 * rng.standard_normal((rows, cells))
+    return jacobian
+
+def create_grid_mesh(cells: int):
+    """ Creates a rectangular grid mesh with roughly the given count of cells.
+
+    Parameter:
+        cells: The requested count of cells.
+
+    Returns:
+        The created mesh.
+    """
+    nz = int(np.floor(np.sqrt(cells / 4)))
+    nx = int(np.ceil(cells / nz))
+    return pg.createGrid(x=np.linspace(0, nx, nx + 1), y=np.linspace(-nz, 0, nz + 1))
+
+def get_thinning_factors(electrode_count: int):
+    """ Returns the thinning factors leading to more than 4 electrodes (see ResolutionElectrodeUpdater). """
+    return [f for f in range(1, electrode_count)
+            if (electrode_count - 1) % f == 0 and (electrode_count - 1) // f + 1 > 4]
+
+def prepare_case(name: str, params: dict, rng: np.random.Generator, folder: str):
+    """ Creates the input data of a benchmark case.
+
+    Parameter:
+        name: The name of the benchmark.
+        params: The sizes of the case.
+        rng: The random number generator.
+        folder: A temporary folder for files written by the benchmarked code.
+
+    Returns:
+        A function running the benchmarked code once.
+    """
+    if name == 'merge_schemes':
+        scheme1 = create_random_scheme(rng=rng, electrode_count=params['electrodes'], size=params['pool'])
+        scheme2 = create_overlapping_scheme(rng=rng, scheme=scheme1, electrode_count=params['electrodes'])
+        return lambda: su.merge_schemes(scheme1=scheme1, scheme2=scheme2)
+    if name == 'find_duplicate_configurations':
+        scheme1 = create_random_scheme(rng=rng, electrode_count=params['electrodes'], size=params['pool'])
+        scheme2 = create_overlapping_scheme(rng=rng, scheme=scheme1, electrode_count=params['electrodes'])
+        return lambda: su.find_duplicate_configurations(scheme1=scheme1, scheme2=scheme2)
+    if name == 'extract_configs_from_scheme':
+        scheme = create_random_scheme(rng=rng, electrode_count=params['electrodes'], size=params['pool'])
+        config_indices = np.sort(rng.permutation(scheme.size())[0:scheme.size() // 10])
+        return lambda: su.extract_configs_from_scheme(scheme=scheme, config_indices=config_indices)
+    if name == 'create_comprehensive_scheme':
+        electrodes = np.arange(params['electrodes'], dtype=float)
+        thinning_factors = get_thinning_factors(params['electrodes'])
+        return lambda: su.create_comprehensive_scheme(electrodes=electrodes, scheme_names=SCHEME_NAMES,
+                                                      thinning_factors=thinning_factors)
+    if name == 'compute_next_configs':
+        mesh = create_grid_mesh(params['cells'])
+        nm = mesh.cellCount()
+        scheme_compr = create_random_scheme(rng=rng, electrode_count=SELECTION_ELECTRODES, size=params['pool'])
+        j_compr = create_random_jacobian(rng=rng, rows=params['pool'], cells=nm)
+        base_indices = np.arange(min(SELECTION_BASE_COUNT, params['pool'] // 2))
+        scheme_base = su.extract_configs_from_scheme(scheme=scheme_compr, config_indices=base_indices)
+        j_base = j_compr[base_indices]
+        cell_data = pg.RVector(np.exp(rng.normal(np.log(100), 0.5, nm)))
+        updater = ResolutionElectrodeUpdater(world_x=SELECTION_ELECTRODES - 1, spacing=1, electrode_offset=0,
+                                             base_configs=['dd'], add_configs=SCHEME_NAMES, gradient_weight=0,
+                                             addconfig_count=50, li_threshold=0.95)
+        updater.set_essentials(folder)
+
+        def run():
+            # The base factorization is never reused between repeats
+            updater.reset_factorization()
+            return updater.select_configs(scheme_base=scheme_base, scheme_compr=scheme_compr, j_base=j_base,
+                                          j_compr=j_compr, j_compr_indices=np.arange(params['pool']), mesh=mesh,
+                                          cell_data=cell_data)
+        return run
+    raise ValueError('Unknown benchmark: ' + name)
+
+def estimate_memory_mb(name: str, params: dict):
+    """ Estimates the memory of the largest array of a benchmark case (the synthetic Jacobian) in MB. """
+    if name == 'compute_next_configs':
+        return params['pool'] * params['cells'] * 8 / 2 ** 20
+    return 0
+
+def run_case(name: str, params: dict, repeats: int, seed: int, folder: str):
+    """ Runs a benchmark case several times.
+
+    Parameter:
+        name: The name of the benchmark.
+        params: The sizes of the case.
+        repeats: The count of timed runs (after one warm-up run).
+        seed: The seed of the random number generator.
+        folder: A temporary folder for files written by the benchmarked code.
+
+    Returns:
+        A dictionary describing the case and its run times.
+    """
+    run = prepare_case(name=name, params=params, rng=np.random.default_rng(seed), folder=folder)
+    run()
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {'benchmark': name, 'params': params, 'times_s': times, 'median_s': float(np.median(times)),
+            'min_s': float(np.min(times))}
+
+def compute_scaling(results: list):
+    """ Computes scaling curves of the benchmarks.
+
+    Utility function to group the results of every benchmark by all but one parameter and to fit the exponent of a
+    power law (time ~ size^exponent) along the remaining parameter.
+
+    Parameter:
+        results: The results of run_case(...).
+
+    Returns:
+        A list of scaling curves.
+    """
+    curves = []
+    for name in dict.fromkeys(result['benchmark'] for result in results):
+        cases = [result for result in results if result['benchmark'] == name]
+        for parameter in cases[0]['params']:
+            groups = {}
+            for case in cases:
+                fixed = {key: value for key, value in case['params'].items() if key != parameter}
+                groups.setdefault(json.dumps(fixed, sort_keys=True), []).append(case)
+            for fixed, group in groups.items():
+                group = sorted(group, key=lambda case: case['params'][parameter])
+                sizes = [case['params'][parameter] for case in group]
+                medians = [case['median_s'] for case in group]
+                if len(set(sizes)) < 2:
+                    continue
+                exponent = np.polyfit(np.log(sizes), np.log(np.maximum(medians, 1e-9)), 1)[0]
+                curves.append({'benchmark': name, 'parameter': parameter, 'fixed': json.loads(fixed), 'sizes': sizes,
+                               'median_s': medians, 'exponent': float(exponent)})
+    return curves
+
+def compare_with_baseline(results: list, baseline: dict, tolerance: float):
+    """ Compares the results with the results of a baseline run.
+
+    Parameter:
+        results: The results of run_case(...).
+        baseline: The output of a former benchmark run.
+        tolerance: The relative slowdown of the median run time which is reported as regression.
+
+    Returns:
+        A list with one comparison per case contained in both runs.
+    """
+    baseline_cases = {case_key(case): case for case in baseline['results']}
+    comparison = []
+    for result in results:
+        key = case_key(result)
+        if key not in baseline_cases:
+            continue
+        ratio = result['median_s'] / max(baseline_cases[key]['median_s'], 1e-9)
+        comparison.append({'benchmark': result['benchmark'], 'params': result['params'],
+                           'baseline_median_s': baseline_cases[key]['median_s'], 'median_s': result['median_s'],
+                           'ratio': ratio, 'regression': bool(ratio > 1 + tolerance)})
+    return comparison
+
+def load_baseline(file: str, profile: str, seed: int):
+    """ Loads the results of a baseline run.
+
+    Parameter:
+        file: The result file of the baseline run. An empty string or None disables the comparison.
+        profile: The profile of the current run.
+        seed: The seed of the current run.
+
+    Returns:
+        The baseline run or None if there is no comparable baseline.
+    """
+    if not file:
+        return None
+    if not os.path.isfile(file):
+        print('No baseline found at ' + file + ', skipping the comparison')
+        return None
+    with open(file) as f:
+        baseline = json.load(f)
+    if baseline['profile'] != profile or baseline['seed'] != seed:
+        print('Baseline was recorded with profile %s and seed %s, skipping the comparison'
+              % (baseline['profile'], baseline['seed']))
+        return None
+    if len(baseline['results']) == 0:
+        print('Baseline ' + file + ' contains no results, record it with --save-baseline')
+        return None
+    return baseline
+
+def case_key(case: dict):
+    """ Returns a key identifying a benchmark case by its name and sizes. """
+    return case['benchmark'] + json.dumps(case['params'], sort_keys=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the electrode selection hot paths on synthetic data.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick', help='the benchmark sizes')
+    parser.add_argument('--benchmarks', nargs='*', help='the benchmarks to run (default: all)')
+    parser.add_argument('--repeats', type=int, default=3, help='timed runs per case')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--max-memory-mb', type=float, default=4096,
+                        help='skip cases whose synthetic Jacobian exceeds this size')
+    parser.add_argument('--output', default='benchmark_results.json', help='the result file')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='a former result file to compare with (default: the committed reference results, '
+                             'an empty string disables the comparison)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also save the results as new reference results (see --baseline)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative slowdown reported as regression')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s: %(message)s')
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, sizes in PROFILES[args.profile].items():
+            if args.benchmarks and name not in args.benchmarks:
+                continue
+            for values in itertools.product(*sizes.values()):
+                params = dict(zip(sizes.keys(), values))
+                memory_mb = estimate_memory_mb(name=name, params=params)
+                if memory_mb > args.max_memory_mb:
+                    print('%-32s %-36s skipped (%.0f MB)' % (name, params, memory_mb))
+                    continue
+                result = run_case(name=name, params=params, repeats=args.repeats, seed=args.seed,
+                                  folder=folder + os.sep)
+                results.append(result)
+                print('%-32s %-36s median %10.4f s  min %10.4f s' % (name, params, result['median_s'],
+                                                                      result['min_s']))
+
+    output = {'created': datetime.datetime.now().isoformat(), 'profile': args.profile, 'repeats': args.repeats,
+              'seed': args.seed, 'platform': platform.platform(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'results': results, 'scaling': compute_scaling(results)}
+    for curve in output['scaling']:
+        print('scaling %-32s %-10s %-36s exponent %.2f' % (curve['benchmark'], curve['parameter'], curve['fixed'],
+                                                            curve['exponent']))
+    regressions = []
+    baseline = load_baseline(file=args.baseline, profile=args.profile, seed=args.seed)
+    if baseline is not None:
+        output['comparison'] = compare_with_baseline(results=results, baseline=baseline, tolerance=args.tolerance)
+        regressions = [entry for entry in output['comparison'] if entry['regression']]
+        for entry in output['comparison']:
+            print('%-32s %-36s %6.2fx%s' % (entry['benchmark'], entry['params'], entry['ratio'],
+                                            '  REGRESSION' if entry['regression'] else ''))
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print('Results saved to: ' + args.output)
+    if args.save_baseline:
+        output.pop('comparison', None)
+        with open(args.baseline or BASELINE_FILE, 'w') as f:
+            json.dump(output, f, indent=2)
+        print('Reference results saved to: ' + (args.baseline or BASELINE_FILE))
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -67,14 +67,14 @@ while np.floor((electrode_counts[j]-1)/2) == (electrode_counts[j]-1)/2:
 comp_scheme = pb.createData(elecs=comp_electrodes[0], schemeName=schemes[0])
 for j in range(1,len(comp_electrodes)):
     scheme_tmp = pb.createData(elecs=comp_electrodes[j], schemeName=schemes[0])
-    comp_scheme = su.merge_schemes(comp_scheme, scheme_tmp, folder + 'tmp/')
+    comp_scheme = su.merge_schemes(comp_scheme, scheme_tmp)
 
 for i in range(1,len(schemes)):
     scheme_tmp = pb.createData(elecs=comp_electrodes[0], schemeName=schemes[i])
     for j in range(1, len(comp_electrodes)):
         scheme_tmp2 = pb.createData(elecs=comp_electrodes[j], schemeName=schemes[i])
-        scheme_tmp = su.merge_schemes(scheme_tmp, scheme_tmp2, folder + 'tmp/')
-    comp_scheme = su.merge_schemes(comp_scheme, scheme_tmp, folder + 'tmp/')
+        scheme_tmp = su.merge_schemes(scheme_tmp, scheme_tmp2)
+    comp_scheme = su.merge_schemes(comp_scheme, scheme_tmp)
 scheme = comp_scheme
 
 # create mesh
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pybert as pb
+import pygimli as pg
+
+import util.schemeUtil as schemeUtil
+
+# Version of the cached artifacts, part of every key. Increase it whenever the generation or the storage format of a
+# cached artifact changes (e.g. the comprehensive scheme, the meshes or the adjacency), so outdated entries are missed.
+ARTIFACT_VERSION = 1
+
+class ArtifactCache:
+    """ A persistent, content-addressed cache for generated schemes, meshes and arrays.
+
+    This class stores expensive to generate artifacts (e.g. the comprehensive scheme, simulation and parameter meshes
+    or neighbour tables) in a cache directory shared by several runs. Entries are addressed by a fingerprint of
+    everything they depend on (see fingerprint(...)), so changed settings never hit outdated entries. Schemes and arrays
+    are stored as .npz files, meshes in the binary pygimli format. Entries are written atomically. When the cache
+    exceeds its size limit, the least recently used entries are removed.
+
+    Parameter:
+        folder: The cache directory. Will be created if it does not exist.
+        max_mb: (optional) The size limit of the cache directory in MB. None disables the eviction.
+
+    Typical usage example:
+        cache = ArtifactCache(folder, max_mb=500)
+        key = ArtifactCache.fingerprint('sim_mesh', world_x, world_z, sensor_positions)
+        mesh = cache.load_mesh(key)
+        if mesh is None:
+            mesh = ...
+            cache.save_mesh(key, mesh)
+    """
+    def __init__(self, folder: str, max_mb=None):
+        self.__folder = folder if folder.endswith('/') else folder + '/'
+        self.__max_mb = max_mb
+        os.makedirs(self.__folder, exist_ok=True)
+
+    @property
+    def folder(self):
+        """ The cache directory. """
+        return self.__folder
+
+    @staticmethod
+    def fingerprint(*parts):
+        """ Computes the key of a cache entry.
+
+        The key starts with ARTIFACT_VERSION, so entries of older generators are never hit.
+
+        Parameter:
+            parts: Everything the entry depends on. Numpy arrays are hashed by shape, type and content, all other parts
+                   by their JSON (or string) representation.
+
+        Returns:
+            The key as hexadecimal string.
+        """
+        sha = hashlib.sha1()
+        for part in (ARTIFACT_VERSION,) + parts:
+            if isinstance(part, np.ndarray):
+                sha.update(str((part.shape, part.dtype.str)).encode())
+                sha.update(np.ascontiguousarray(part).tobytes())
+            else:
+                sha.update(json.dumps(part, sort_keys=True, default=str).encode())
+            sha.update(b'|')
+        return sha.hexdigest()
+
+    def load_scheme(self, key: str):
+        """ Loads a cached scheme.
+
+        Parameter:
+            key: The key of the entry.
+
+        Returns:
+            The scheme or None if there is no entry.
+        """
+        arrays = self.load_arrays(key)
+        if arrays is None:
+            return None
+        sensor_positions = arrays.pop('sensor_positions')
+        return schemeUtil.create_scheme(sensor_positions=sensor_positions, columns=arrays)
+
+    def save_scheme(self, key: str, scheme: pb.DataContainerERT):
+        """ Stores a scheme in the cache.
+
+        Parameter:
+            key: The key of the entry.
+            scheme: The scheme to be stored.
+        """
+        arrays = schemeUtil.get_columns(scheme)
+        arrays['sensor_positions'] = schemeUtil.get_sensor_positions(scheme)
+        self.save_arrays(key, arrays)
+
+    def load_mesh(self, key: str):
+        """ Loads a cached mesh.
+
+        Parameter:
+            key: The key of the entry.
+
+        Returns:
+            The mesh or None if there is no entry.
+        """
+        file = self.__hit(key + '.bms')
+        if file is None:
+            return None
+        mesh = pg.Mesh()
+        try:
+            mesh.loadBinaryV2(file)
+        except (FileNotFoundError, RuntimeError):
+            mesh = None
+        if mesh is None or mesh.nodeCount() == 0:
+            # Evicted by another process after the lookup (pygimli reports a missing file as RuntimeError)
+            logging.info('Cache miss: ' + key + '.bms')
+            return None
+        return mesh
+
+    def save_mesh(self, key: str, mesh: pg.Mesh):
+        """ Stores a mesh in the cache.
+
+        Parameter:
+            key: The key of the entry.
+            mesh: The mesh to be stored.
+        """
+        tmp_file = self.__folder + key + '.tmp{:d}.bms'.format(os.getpid())
+        mesh.saveBinaryV2(tmp_file)
+        self.__commit(tmp_file, key + '.bms')
+
+    def load_arrays(self, key: str):
+        """ Loads cached numpy arrays.
+
+        Parameter:
+            key: The key of the entry.
+
+        Returns:
+            A dictionary of the arrays or None if there is no entry.
+        """
+        file = self.__hit(key + '.npz')
+        if file is None:
+            return None
+        try:
+            with np.load(file) as data:
+                return {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            # Evicted by another process after the lookup
+            logging.info('Cache miss: ' + key + '.npz')
+            return None
+
+    def save_arrays(self, key: str, arrays: dict):
+        """ Stores numpy arrays in the cache.
+
+        Parameter:
+            key: The key of the entry.
+            arrays: A dictionary of the arrays to be stored.
+        """
+        tmp_file = self.__folder + key + '.tmp{:d}.npz'.format(os.getpid())
+        np.savez(tmp_file, **arrays)
+        self.__commit(tmp_file, key + '.npz')
+
+    def __hit(self, name: str):
+        """ Looks up a cache file and marks it as recently used.
+
+        Parameter:
+            name: The file name of the entry.
+
+        Returns:
+            The path of the file or None if there is no such entry.
+        """
+        file = self.__folder + name
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            logging.info('Cache miss: ' + name)
+            return None
+        logging.info('Cache hit: ' + name)
+        return file
+
+    def __commit(self, tmp_file: str, name: str):
+        """ Moves a written temporary file to its entry and enforces the size limit.
+
+        Parameter:
+            tmp_file: The temporary file.
+            name: The file name of the entry.
+        """
+        os.replace(tmp_file, self.__folder + name)
+        logging.info('Cache entry stored: ' + name)
+        self.__evict()
+
+    def __evict(self):
+        """ Removes the least recently used entries until the cache fits its size limit. """
+        if self.__max_mb is None:
+            return
+        entries = []
+        for name in os.listdir(self.__folder):
+            if '.tmp' in name:
+                continue
+            try:
+                stat = os.stat(self.__folder + name)
+            except FileNotFoundError:
+                # Removed by another process sharing the cache directory
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total_size = sum(entry[1] for entry in entries)
+        # Keep at least the newest entry, even if it is larger than the limit
+        while total_size > self.__max_mb * 2 ** 20 and len(entries) > 1:
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(self.__folder + name)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            logging.info('Cache entry evicted: ' + name)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import itertools
+
+import numpy as np
+
+class ElectrodeRegistry:
+    """ A register of electrode positions with tolerance-based matching.
+
+    This class assigns global ids to electrode (sensor) positions of one or more schemes. Positions are stored in a
+    spatial hash on a grid with the tolerance as cell size, so positions closer than the tolerance are matched in
+    constant time by checking the neighbouring cells. This makes positions which only differ in the last bits (e.g. from
+    pg.utils.grange with different electrode counts) map to the same electrode.
+
+    Parameter:
+        tolerance: (optional) The highest distance of two positions which are considered as the same electrode.
+
+    Typical usage example:
+        registry = ElectrodeRegistry(tolerance=1e-6)
+        ids1 = registry.register(positions1)
+        ids2 = registry.register(positions2)
+        electrodes = registry.positions
+    """
+    def __init__(self, tolerance=1e-6):
+        self.__tolerance = tolerance
+        self.__positions = []
+        self.__cells = {}
+
+    @property
+    def tolerance(self):
+        """ The highest distance of two positions which are considered as the same electrode. """
+        return self.__tolerance
+
+    @property
+    def positions(self):
+        """ The positions of all registered electrodes (in global id order) with one row (x, y, z) per electrode. """
+        return np.reshape(self.__positions, (-1, 3))
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def register(self, positions: np.ndarray):
+        """ Registers electrode positions.
+
+        Maps every position to the id of an already registered electrode within the tolerance. Unknown positions are
+        registered as new electrodes.
+
+        Parameter:
+            positions: The electrode positions with one row (x, y, z) per electrode.
+
+        Returns:
+            The global ids of the electrodes as array (usable to remap local electrode indices of a scheme).
+        """
+        return self.__map(positions=positions, add=True)
+
+    def lookup(self, positions: np.ndarray):
+        """ Finds the global ids of electrode positions without registering unknown ones.
+
+        Parameter:
+            positions: The electrode positions with one row (x, y, z) per electrode.
+
+        Returns:
+            The global ids of the electrodes as array. Unknown positions are marked with -1.
+        """
+        return self.__map(positions=positions, add=False)
+
+    def __map(self, positions: np.ndarray, add: bool):
+        """ Maps positions to global ids.
+
+        Parameter:
+            positions: The electrode positions with one row (x, y, z) per electrode.
+            add: Whether unknown positions should be registered.
+
+        Returns:
+            The global ids of the electrodes as array.
+        """
+        positions = np.reshape(np.asarray(positions, dtype=float), (-1, 3))
+        cells = np.floor(positions / self.__tolerance).astype(np.int64)
+        ids = np.full(len(positions), -1, dtype=np.int64)
+        for i in range(len(positions)):
+            cell = tuple(cells[i])
+            ids[i] = self.__find(position=positions[i], cell=cell)
+            if ids[i] < 0 and add:
+                ids[i] = len(self.__positions)
+                self.__positions.append(positions[i])
+                self.__cells.setdefault(cell, []).append(ids[i])
+        return ids
+
+    def __find(self, position: np.ndarray, cell: tuple):
+        """ Finds the closest registered electrode within the tolerance.
+
+        Parameter:
+            position: The electrode position.
+            cell: The hash grid cell of the position.
+
+        Returns:
+            The global id of the electrode or -1 if there is none.
+        """
+        # Fast path for identical positions
+        for electrode_id in self.__cells.get(cell, []):
+            if np.array_equal(self.__positions[electrode_id], position):
+                return electrode_id
+        best_id = -1
+        best_distance = self.__tolerance
+        for offset in itertools.product([-1, 0, 1], repeat=3):
+            neighbour = (cell[0] + offset[0], cell[1] + offset[1], cell[2] + offset[2])
+            for electrode_id in self.__cells.get(neighbour, []):
+                distance = np.linalg.norm(self.__positions[electrode_id] - position)
+                if distance <= best_distance:
+                    best_id = electrode_id
+                    best_distance = distance
+        return best_id
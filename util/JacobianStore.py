@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import os
+
+import numpy as np
+
+class JacobianStore:
+    """ A disk-backed storage for large Jacobian (sensitivity) matrices.
+
+    This class keeps a Jacobian matrix in a memory-mapped file, so only the currently processed rows have to be held in
+    memory. Rows are written block-wise and read either by slicing or through index views (see rows(...)), which
+    reference a subset of rows without copying them. Optionally, the matrix is stored with single precision.
+
+    Parameter:
+        folder: The folder the memory-mapped file is created in.
+        n_rows: The row (configuration) count of the matrix.
+        n_cols: The column (mesh cell) count of the matrix.
+        dtype: (optional) The data type used for storing the matrix, e.g. np.float32 to halve the file size.
+        name: (optional) The name of the memory-mapped file (without extension).
+
+    Typical usage example:
+        store = JacobianStore(folder, n_rows, n_cols, dtype=np.float32)
+        store.write_rows(start=0, rows=block)
+        for block in store.rows(indices).iter_blocks(block_size=1024):
+            ...
+        store.close()
+    """
+    def __init__(self, folder: str, n_rows: int, n_cols: int, dtype=np.float64, name='jacobian'):
+        self.__file = folder + name + '.mmap'
+        self.__matrix = np.memmap(self.__file, dtype=dtype, mode='w+', shape=(max(n_rows, 1), n_cols))
+        self.__n_rows = n_rows
+
+    @property
+    def shape(self):
+        """ The shape of the stored matrix. """
+        return self.__n_rows, self.__matrix.shape[1]
+
+    @property
+    def dtype(self):
+        """ The data type of the stored matrix. """
+        return self.__matrix.dtype
+
+    def __len__(self):
+        return self.__n_rows
+
+    def __getitem__(self, key):
+        """ Reads rows of the stored matrix.
+
+        Parameter:
+            key: A row index, a slice or an index array.
+
+        Returns:
+            The requested rows as in-memory numpy array.
+        """
+        if isinstance(key, slice):
+            key = slice(*key.indices(self.__n_rows))
+        return np.array(self.__matrix[key])
+
+    def write_rows(self, start: int, rows: np.ndarray):
+        """ Writes consecutive rows to the stored matrix.
+
+        Parameter:
+            start: The index of the first written row.
+            rows: The rows to be written.
+        """
+        self.__matrix[start:start + len(rows)] = rows
+
+    def rows(self, indices: np.ndarray):
+        """ Creates a view on a subset of rows.
+
+        Parameter:
+            indices: The indices of the rows in the view (in view order).
+
+        Returns:
+            A JacobianView referencing the rows.
+        """
+        return JacobianView(store=self, indices=np.asarray(indices, dtype=int))
+
+    def iter_blocks(self, block_size: int):
+        """ Yields the stored matrix in consecutive blocks of rows.
+
+        Parameter:
+            block_size: The maximum row count per block.
+
+        Returns:
+            A generator of row blocks as in-memory numpy arrays.
+        """
+        for start in range(0, self.__n_rows, block_size):
+            yield self[start:start + block_size]
+
+    def flush(self):
+        """ Writes all pending changes to disk. """
+        self.__matrix.flush()
+
+    def close(self):
+        """ Releases the memory-mapped file and removes it from disk. """
+        del self.__matrix
+        if os.path.exists(self.__file):
+            os.remove(self.__file)
+
+
+class JacobianView:
+    """ An index view on the rows of a JacobianStore.
+
+    This class references a subset of rows of a JacobianStore without copying them. It supports the same read access as
+    the store, with indices relative to the view.
+
+    Parameter:
+        store: The JacobianStore holding the rows.
+        indices: The store indices of the rows in the view.
+    """
+    def __init__(self, store: JacobianStore, indices: np.ndarray):
+        self.__store = store
+        self.__indices = indices
+
+    @property
+    def shape(self):
+        """ The shape of the viewed matrix. """
+        return len(self.__indices), self.__store.shape[1]
+
+    @property
+    def dtype(self):
+        """ The data type of the viewed matrix. """
+        return self.__store.dtype
+
+    @property
+    def indices(self):
+        """ The store indices of the rows in the view. """
+        return self.__indices
+
+    def __len__(self):
+        return len(self.__indices)
+
+    def __getitem__(self, key):
+        """ Reads rows of the view.
+
+        Parameter:
+            key: A row index, a slice or an index array (relative to the view).
+
+        Returns:
+            The requested rows as in-memory numpy array.
+        """
+        return self.__store[self.__indices[key]]
+
+    def rows(self, indices: np.ndarray):
+        """ Creates a view on a subset of the viewed rows.
+
+        Parameter:
+            indices: The view indices of the rows in the new view.
+
+        Returns:
+            A JacobianView referencing the rows.
+        """
+        return JacobianView(store=self.__store, indices=self.__indices[np.asarray(indices, dtype=int)])
+
+    def iter_blocks(self, block_size: int):
+        """ Yields the viewed rows in consecutive blocks.
+
+        Parameter:
+            block_size: The maximum row count per block.
+
+        Returns:
+            A generator of row blocks as in-memory numpy arrays.
+        """
+        for start in range(0, len(self.__indices), block_size):
+            yield self[start:start + block_size]
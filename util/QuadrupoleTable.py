@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pybert as pb
+
+from util.ElectrodeRegistry import ElectrodeRegistry
+from util.containerUtil import create_scheme
+
+# Highest electrode id which can be encoded in a configuration key (four ids in one int64)
+MAX_ELECTRODE_ID = 2 ** 15 - 2
+
+class QuadrupoleTable:
+    """ A compact table of electrode configurations (quadrupoles).
+
+    This class stores electrode configurations as int32 electrode id arrays referring to the global electrodes of an
+    ElectrodeRegistry, which makes configurations of different schemes directly comparable. Every configuration is
+    identified by a canonical int64 key, which ignores the order of the current electrodes (A/B) and of the potential
+    electrodes (M/N). Tables support membership tests, set operations returning index arrays and are only converted to
+    a DataContainerERT when pybert needs one.
+
+    Tables are used for the configuration set operations (see schemeUtil.merge_schemes(...),
+    schemeUtil.find_duplicate_configurations(...), the comprehensive scheme creation and the incremental simulation).
+    The ElectrodeUpdater interface, the checkpoints and the pybert simulation and inversion keep exchanging
+    DataContainerERT objects, as they also carry data columns (e.g. rhoa and err) and pybert needs them anyway.
+
+    Parameter:
+        a: The global ids of the first current electrodes (-1 marks an unused electrode).
+        b: The global ids of the second current electrodes.
+        m: The global ids of the first potential electrodes.
+        n: The global ids of the second potential electrodes.
+        registry: The ElectrodeRegistry the electrode ids refer to.
+
+    Typical usage example:
+        registry = ElectrodeRegistry()
+        table1 = QuadrupoleTable.from_scheme(scheme1, registry)
+        table2 = QuadrupoleTable.from_scheme(scheme2, registry)
+        new_indices = table1.union(table2)
+        scheme = table2.subset(new_indices).to_scheme()
+    """
+    def __init__(self, a: np.ndarray, b: np.ndarray, m: np.ndarray, n: np.ndarray, registry: ElectrodeRegistry):
+        self.__columns = {'a': np.asarray(a, dtype=np.int32), 'b': np.asarray(b, dtype=np.int32),
+                          'm': np.asarray(m, dtype=np.int32), 'n': np.asarray(n, dtype=np.int32)}
+        self.__registry = registry
+        self.__keys = None
+        self.__lookup = None
+        self.__scheme = None
+
+    @classmethod
+    def from_scheme(cls, scheme: pb.DataContainerERT, registry: ElectrodeRegistry):
+        """ Creates a table from the configurations of a scheme.
+
+        The sensors of the scheme are registered in the registry first.
+
+        Parameter:
+            scheme: The scheme containing the configurations.
+            registry: The ElectrodeRegistry used for the global electrode ids.
+
+        Returns:
+            The created QuadrupoleTable.
+        """
+        positions = scheme.sensorPositions()
+        ids = registry.register([[positions[i][0], positions[i][1], positions[i][2]] for i in range(len(positions))])
+        columns = {}
+        for token in ['a', 'b', 'm', 'n']:
+            column = np.array(scheme(token), dtype=np.int64)
+            columns[token] = np.where(column >= 0, ids[np.clip(column, 0, None)], -1)
+        return cls(registry=registry, **columns)
+
+    @staticmethod
+    def encode(a: np.ndarray, b: np.ndarray, m: np.ndarray, n: np.ndarray):
+        """ Encodes electrode configurations as canonical integer keys.
+
+        The current electrodes and the potential electrodes are sorted before encoding, so swapping A/B or M/N results
+        in the same key.
+
+        Parameter:
+            a: The global ids of the first current electrodes (-1 marks an unused electrode).
+            b: The global ids of the second current electrodes.
+            m: The global ids of the first potential electrodes.
+            n: The global ids of the second potential electrodes.
+
+        Returns:
+            The keys of the configurations as int64 array.
+        """
+        a, b, m, n = [np.asarray(column, dtype=np.int64) for column in [a, b, m, n]]
+        if len(a) > 0 and max(np.max(a), np.max(b), np.max(m), np.max(n)) > MAX_ELECTRODE_ID:
+            raise ValueError('Electrode ids above %d can not be encoded' % MAX_ELECTRODE_ID)
+        base = np.int64(MAX_ELECTRODE_ID + 2)
+        keys = np.minimum(a, b) + 1
+        for column in [np.maximum(a, b), np.minimum(m, n), np.maximum(m, n)]:
+            keys = keys * base + column + 1
+        return keys
+
+    @property
+    def registry(self):
+        """ The ElectrodeRegistry the electrode ids refer to. """
+        return self.__registry
+
+    @property
+    def a(self):
+        """ The global ids of the first current electrodes. """
+        return self.__columns['a']
+
+    @property
+    def b(self):
+        """ The global ids of the second current electrodes. """
+        return self.__columns['b']
+
+    @property
+    def m(self):
+        """ The global ids of the first potential electrodes. """
+        return self.__columns['m']
+
+    @property
+    def n(self):
+        """ The global ids of the second potential electrodes. """
+        return self.__columns['n']
+
+    @property
+    def keys(self):
+        """ The canonical keys of all configurations (see encode(...)). """
+        if self.__keys is None:
+            self.__keys = self.encode(self.a, self.b, self.m, self.n)
+        return self.__keys
+
+    def __len__(self):
+        return len(self.a)
+
+    def __contains__(self, quadrupole):
+        return self.index_of(*quadrupole) >= 0
+
+    def index_of(self, a: int, b: int, m: int, n: int):
+        """ Finds a configuration in the table.
+
+        Parameter:
+            a: The global id of the first current electrode.
+            b: The global id of the second current electrode.
+            m: The global id of the first potential electrode.
+            n: The global id of the second potential electrode.
+
+        Returns:
+            The index of the first occurrence of the configuration (in any A/B and M/N order) or -1 if there is none.
+        """
+        if self.__lookup is None:
+            self.__lookup = {}
+            for i, key in enumerate(self.keys.tolist()):
+                self.__lookup.setdefault(key, i)
+        return self.__lookup.get(int(self.encode([a], [b], [m], [n])[0]), -1)
+
+    def subset(self, indices: np.ndarray):
+        """ Creates a table containing a subset of the configurations.
+
+        Parameter:
+            indices: The indices of the configurations (in the order of the new table).
+
+        Returns:
+            The created QuadrupoleTable (using the same registry).
+        """
+        indices = np.asarray(indices, dtype=int)
+        return QuadrupoleTable(registry=self.__registry,
+                               **{token: column[indices] for token, column in self.__columns.items()})
+
+    def unique(self):
+        """ Finds the first occurrence of every configuration.
+
+        Returns:
+            The sorted indices of the first occurrences.
+        """
+        _, first_indices = np.unique(self.keys, return_index=True)
+        return np.sort(first_indices)
+
+    def match(self, other):
+        """ Finds the configurations of another table in this table.
+
+        Sort-join of the configuration keys of both tables.
+
+        Parameter:
+            other: The QuadrupoleTable containing the configurations to be found (using the same registry).
+
+        Returns:
+            The index of the first occurrence in this table for every configuration of other (-1 if there is none).
+        """
+        self.__check_registry(other)
+        unique_keys, first_indices = np.unique(self.keys, return_index=True)
+        if len(unique_keys) == 0:
+            return np.full(len(other), -1, dtype=int)
+        positions = np.minimum(np.searchsorted(unique_keys, other.keys), len(unique_keys) - 1)
+        return np.where(unique_keys[positions] == other.keys, first_indices[positions], -1)
+
+    def intersection(self, other):
+        """ Finds the configurations of this table which are also contained in another table.
+
+        Parameter:
+            other: The other QuadrupoleTable (using the same registry).
+
+        Returns:
+            The indices of the configurations of this table which are contained in other.
+        """
+        self.__check_registry(other)
+        return np.nonzero(np.isin(self.keys, other.keys))[0]
+
+    def difference(self, other):
+        """ Finds the configurations of this table which are not contained in another table.
+
+        Parameter:
+            other: The other QuadrupoleTable (using the same registry).
+
+        Returns:
+            The indices of the configurations of this table which are not contained in other.
+        """
+        self.__check_registry(other)
+        return np.nonzero(np.logical_not(np.isin(self.keys, other.keys)))[0]
+
+    def union(self, other):
+        """ Finds the configurations of another table which extend this table.
+
+        The union of both tables consists of all configurations of this table followed by the returned configurations
+        of other.
+
+        Parameter:
+            other: The other QuadrupoleTable (using the same registry).
+
+        Returns:
+            The indices of the first occurrences of the configurations of other which are not contained in this table.
+        """
+        self.__check_registry(other)
+        first_indices = other.unique()
+        return first_indices[np.logical_not(np.isin(other.keys[first_indices], self.keys))]
+
+    def to_scheme(self, data=None):
+        """ Converts the table to a scheme.
+
+        The scheme uses all electrodes of the registry as sensors. Without data, the created scheme is kept and
+        returned again by following calls.
+
+        Parameter:
+            data: (optional) A dictionary mapping data tokens (e.g. 'rhoa') to columns with one value per configuration.
+
+        Returns:
+            The created scheme.
+        """
+        if data is None and self.__scheme is not None:
+            return self.__scheme
+        columns = dict(self.__columns)
+        columns.update({} if data is None else data)
+        scheme = create_scheme(sensor_positions=self.__registry.positions, columns=columns)
+        if data is None:
+            self.__scheme = scheme
+        return scheme
+
+    def __check_registry(self, other):
+        """ Checks whether another table refers to the same electrodes.
+
+        Parameter:
+            other: The other QuadrupoleTable.
+        """
+        if other.registry is not self.__registry:
+            raise ValueError('QuadrupoleTables have to use the same ElectrodeRegistry')
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pybert as pb
+
+class SchemeView:
+    """ An index view on the electrode configurations of a scheme.
+
+    This class references a subset of configurations of a parent scheme without creating a new DataContainerERT. It
+    provides the read access used by the schemeUtil functions (sensorPositions(), size() and column access by token),
+    so views can be merged or compared like schemes. Columns are fetched from the parent scheme once per access and
+    reduced to the viewed configurations.
+
+    Parameter:
+        scheme: The parent scheme.
+        indices: The indices of the viewed configurations in the parent scheme.
+
+    Typical usage example:
+        view = schemeUtil.extract_configs_from_scheme(scheme=scheme, config_indices=indices, view=True)
+        rhoa = view('rhoa')
+        merged = schemeUtil.merge_schemes(scheme1=old_scheme, scheme2=view)
+    """
+    def __init__(self, scheme: pb.DataContainerERT, indices: np.ndarray):
+        self.__scheme = scheme
+        self.__indices = np.asarray(indices, dtype=int)
+
+    @property
+    def scheme(self):
+        """ The parent scheme. """
+        return self.__scheme
+
+    @property
+    def indices(self):
+        """ The indices of the viewed configurations in the parent scheme. """
+        return self.__indices
+
+    def __len__(self):
+        return len(self.__indices)
+
+    def __call__(self, token: str):
+        """ Reads a data column of the viewed configurations.
+
+        Parameter:
+            token: The token of the column, e.g. 'a' or 'rhoa'.
+
+        Returns:
+            The column as numpy array.
+        """
+        return np.asarray(self.__scheme(token))[self.__indices]
+
+    def size(self):
+        """ Returns the count of viewed configurations. """
+        return len(self.__indices)
+
+    def sensorPositions(self):
+        """ Returns the sensor positions of the parent scheme. """
+        return self.__scheme.sensorPositions()
+
+    def subset(self, indices: np.ndarray):
+        """ Creates a view on a subset of the viewed configurations.
+
+        Parameter:
+            indices: The view indices of the configurations in the new view.
+
+        Returns:
+            A SchemeView referencing the configurations.
+        """
+        return SchemeView(scheme=self.__scheme, indices=self.__indices[np.asarray(indices, dtype=int)])
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pybert as pb
+import pygimli as pg
+
+def create_scheme(sensor_positions: np.ndarray, columns: dict):
+    """ Creates a scheme from sensor positions and data columns.
+
+    Utility function to build a scheme directly in memory. Electrode indices in columns are zero-based, -1 marks an
+    unused electrode (e.g. for pole configurations).
+
+    Parameter:
+        sensor_positions: The sensor positions with one row (x, y, z) per sensor.
+        columns: A dictionary mapping tokens to columns. Has to contain the sensor tokens. All columns need the same
+                 length.
+
+    Returns:
+        The created scheme.
+    """
+    scheme = pb.DataContainerERT()
+    for position in sensor_positions:
+        scheme.createSensor(pg.RVector3(position[0], position[1], position[2]))
+    scheme.resize(len(columns['a']))
+    for token, column in columns.items():
+        scheme.set(token, pg.RVector(np.asarray(column, dtype=float)))
+    if 'valid' not in columns:
+        scheme.set('valid', pg.RVector(np.ones(len(columns['a']))))
+    return scheme
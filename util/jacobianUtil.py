@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import logging
+import os
+
+import numpy as np
+import pybert as pb
+import pygimli as pg
+
+import util.parallelUtil as parallelUtil
+import util.schemeUtil as schemeUtil
+from util.JacobianStore import JacobianStore
+
+def find_valid_configurations(scheme: pb.DataContainerERT, max_geometric_factor=None):
+    """ Finds the configurations of a scheme which can be used for sensitivity calculations.
+
+    Utility function to filter electrode configurations by their geometric factor instead of simulating data. A
+    configuration is invalid when its geometric factor is not finite or 0 (e.g. coinciding electrodes) or when its
+    absolute value exceeds max_geometric_factor (very small potential differences).
+
+    Parameter:
+        scheme: The electrode configuration scheme to be filtered.
+        max_geometric_factor: (optional) The highest absolute geometric factor which is still accepted. None disables
+                              the upper limit.
+
+    Returns:
+        The indices of the valid configurations and the geometric factors of all configurations.
+    """
+    k = np.array(pb.geometricFactors(scheme))
+    valid = np.isfinite(k) & (k != 0)
+    if max_geometric_factor is not None:
+        valid &= np.abs(k) <= max_geometric_factor
+    return np.nonzero(valid)[0], k
+
+def iter_jacobian_blocks(mesh: pg.Mesh, res: np.ndarray, scheme: pb.DataContainerERT, valid_indices: np.ndarray,
+                         k: np.ndarray, workers=1, chunk_size=None, tmp_dir=None):
+    """ Computes the Jacobian (sensitivity) matrix in blocks of configurations.
+
+    Generator computing the Jacobian (sensitivity) matrix chunk by chunk based on a given mesh with resistivities and
+    the valid configurations of a scheme (see find_valid_configurations(...)). The chunks can be computed in a process
+    pool against the same mesh and model. Every row only depends on its own configuration, so the stacked blocks are
+    identical to the serial computation.
+
+    Parameter:
+        mesh: The mesh used as approximate subsurface model.
+        res: The resistivity vector containing the resistivities for the mesh cells.
+        scheme: The electrode configuration scheme for sensitivity calculation.
+        valid_indices: The indices of the configurations to be used.
+        k: The geometric factors of all configurations of the scheme.
+        workers: (optional) The count of worker processes. 1 computes all chunks in the calling process.
+        chunk_size: (optional) The maximum configuration count per chunk. None uses one chunk per worker.
+        tmp_dir: (optional) Directory to store the mesh for the worker processes in. Needed when workers > 1. The mesh
+                 file is removed when the generator is exhausted or closed.
+
+    Returns:
+        A generator of tuples containing the scheme indices of the rows and the Jacobian block, in scheme order.
+    """
+    if chunk_size is None:
+        chunk_size = np.ceil(len(valid_indices) / max(workers, 1))
+    chunks = parallelUtil.split_indices(count=len(valid_indices), chunk_size=chunk_size)
+    if workers <= 1 or len(chunks) <= 1:
+        mesh_file = None
+    else:
+        mesh_file = tmp_dir + 'jacobianMesh.bms'
+        mesh.saveBinaryV2(mesh_file)
+    # Collect everything the chunks need as picklable arrays
+    sensor_positions = schemeUtil.get_sensor_positions(scheme)
+    columns = schemeUtil.get_columns(scheme, tokens=schemeUtil.SENSOR_TOKENS)
+    columns['k'] = k
+    res = np.asarray(res)
+    tasks = []
+    for chunk in chunks:
+        chunk_columns = {token: column[valid_indices[chunk]] for token, column in columns.items()}
+        tasks.append((mesh if mesh_file is None else mesh_file, res, sensor_positions, chunk_columns))
+    logging.info('Create Jacobian (%d chunks, %d workers)...', len(tasks), workers)
+    blocks = parallelUtil.imap_chunks(function=compute_jacobian_chunk, tasks=tasks, workers=workers)
+    try:
+        for chunk, block in zip(chunks, blocks):
+            yield valid_indices[chunk], block
+    finally:
+        # Shut down the workers before removing the mesh they read
+        blocks.close()
+        if mesh_file is not None and os.path.exists(mesh_file):
+            os.remove(mesh_file)
+
+def compute_jacobian(mesh: pg.Mesh, res: np.ndarray, scheme: pb.DataContainerERT, max_geometric_factor=None,
+                     workers=1, chunk_size=None, tmp_dir=None, store_dtype=None):
+    """ Computes the Jacobian (sensitivity) matrix.
+
+    Computes the Jacobian (sensitivity) matrix based on a given mesh with resistivities and a set of electrode
+    configurations. Invalid configurations are removed based on their geometric factors (see
+    find_valid_configurations(...)), so no forward simulation is needed. The Jacobian is computed in chunks by
+    iter_jacobian_blocks(...). Optionally, the blocks are written to a JacobianStore in tmp_dir as soon as they are
+    computed instead of being stacked in memory.
+
+    Parameter:
+        mesh: The mesh used as approximate subsurface model.
+        res: The resistivity vector containing the resistivities for the mesh cells.
+        scheme: The electrode configuration scheme for sensitivity calculation.
+        max_geometric_factor: (optional) The highest absolute geometric factor which is still accepted.
+        workers: (optional) The count of worker processes. 1 computes all chunks in the calling process.
+        chunk_size: (optional) The maximum configuration count per chunk. None uses one chunk per worker.
+        tmp_dir: (optional) Directory to store the mesh for the worker processes and the JacobianStore in. Needed when
+                 workers > 1 or store_dtype is set.
+        store_dtype: (optional) The data type of a JacobianStore to write the Jacobian to, e.g. np.float32. None
+                     returns the Jacobian as numpy matrix.
+
+    Returns:
+        The Jacobian matrix (as numpy matrix or JacobianStore) and the scheme indices of its rows.
+    """
+    valid_indices, k = find_valid_configurations(scheme=scheme, max_geometric_factor=max_geometric_factor)
+    logging.info('Using %d of %d configurations for the Jacobian', len(valid_indices), len(k))
+    blocks = iter_jacobian_blocks(mesh=mesh, res=res, scheme=scheme, valid_indices=valid_indices, k=k,
+                                  workers=workers, chunk_size=chunk_size, tmp_dir=tmp_dir)
+    if store_dtype is None:
+        jacobian = [block for _, block in blocks]
+        if len(jacobian) == 0:
+            return np.zeros((0, mesh.cellCount())), valid_indices
+        return np.vstack(jacobian), valid_indices
+    store = None
+    start = 0
+    for _, block in blocks:
+        if store is None:
+            store = JacobianStore(folder=tmp_dir, n_rows=len(valid_indices), n_cols=block.shape[1], dtype=store_dtype)
+        store.write_rows(start=start, rows=block)
+        start += len(block)
+    if store is None:
+        store = JacobianStore(folder=tmp_dir, n_rows=0, n_cols=mesh.cellCount(), dtype=store_dtype)
+    store.flush()
+    return store, valid_indices
+
+def compute_jacobian_chunk(task: tuple):
+    """ Computes the Jacobian matrix of a chunk of configurations.
+
+    Worker function of iter_jacobian_blocks(...). Has to stay at module level to be usable in a process pool.
+
+    Parameter:
+        task: A tuple of the mesh (or the path of a mesh saved in binary format), the resistivity vector, the sensor
+              positions and the columns of the chunk (sensor tokens and geometric factors).
+
+    Returns:
+        The Jacobian matrix of the chunk as numpy matrix.
+    """
+    mesh, res, sensor_positions, columns = task
+    if isinstance(mesh, str):
+        mesh_file = mesh
+        mesh = pg.Mesh()
+        mesh.loadBinaryV2(mesh_file)
+    data = schemeUtil.create_scheme(sensor_positions=sensor_positions, columns=columns)
+    # Set essential data for Jacobian computation
+    ert = pb.ERTManager()
+    ert.setMesh(mesh, omitBackground=True)
+    ert.setData(data)
+    ert.fop.createJacobian(res)
+    return pg.utils.base.gmat2numpy(ert.fop.jacobian())
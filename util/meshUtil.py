@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pygimli as pg
+
+def get_cell_centers(mesh: pg.Mesh):
+    """ Returns the cell centers of a mesh as numpy array.
+
+    Parameter:
+        mesh: The mesh containing the cells.
+
+    Returns:
+        The cell centers as array with one row (x, y, z) per cell.
+    """
+    centers = mesh.cellCenters()
+    return np.array([[centers[i][0], centers[i][1], centers[i][2]] for i in range(len(centers))]).reshape(-1, 3)
+
+def compute_cell_adjacency(mesh: pg.Mesh):
+    """ Computes the neighbour pairs of the mesh cells.
+
+    Utility function to build an adjacency index of a mesh from its boundaries. Every inner boundary connects its left
+    and right cell, so every pair of neighbouring cells is listed exactly once.
+
+    Parameter:
+        mesh: The mesh to be indexed.
+
+    Returns:
+        The cell index pairs (one row per pair of neighbouring cells) and the (x, z) distances of their cell centers.
+    """
+    mesh.createNeighbourInfos()
+    pairs = []
+    for boundary in mesh.boundaries():
+        if boundary.leftCell() is not None and boundary.rightCell() is not None:
+            pairs.append([boundary.leftCell().id(), boundary.rightCell().id()])
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    cell_centers = get_cell_centers(mesh)
+    distances = np.linalg.norm(cell_centers[pairs[:, 0], 0:2] - cell_centers[pairs[:, 1], 0:2], axis=1)
+    return pairs, distances
+
+def compute_cell_gradient(cell_data: np.ndarray, pairs: np.ndarray, distances: np.ndarray):
+    """ Computes the mean absolute gradient of cell data towards the neighbouring cells.
+
+    Utility function to compute, for every cell, the mean of |data difference| / center distance over all neighbouring
+    cells, based on an adjacency index (see compute_cell_adjacency(...)).
+
+    Parameter:
+        cell_data: The data (e.g. resistivities) of all cells.
+        pairs: The cell index pairs of neighbouring cells.
+        distances: The center distances of the neighbouring cells.
+
+    Returns:
+        The gradient per cell (0 for cells without neighbours).
+    """
+    cell_data = np.asarray(cell_data, dtype=float)
+    cell_count = len(cell_data)
+    pair_grad = np.abs(cell_data[pairs[:, 0]] - cell_data[pairs[:, 1]]) / distances
+    grad = np.bincount(pairs[:, 0], weights=pair_grad, minlength=cell_count) + \
+        np.bincount(pairs[:, 1], weights=pair_grad, minlength=cell_count)
+    neighbour_count = np.bincount(pairs.ravel(), minlength=cell_count)
+    return grad / np.maximum(neighbour_count, 1)
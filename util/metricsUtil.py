@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import contextlib
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+# Metrics of the current job (see open_metrics(...))
+_metrics_file = None
+_records = []
+_trace_memory = False
+# Traced memory peaks of the running (nested) stages, folded into the enclosing stage when a stage ends
+_peak_stack = []
+
+def open_metrics(file: str, trace_memory=False):
+    """ Starts recording stage metrics to a file.
+
+    Utility function to start a metrics recording for a job. Every stage measured by stage(...) is appended to the
+    file as a JSON line and kept for summarize(...).
+
+    Parameter:
+        file: The metrics file, e.g. folder + 'metrics.jsonl'.
+        trace_memory: (optional) Whether the peak Python memory allocation of every stage should be measured with
+                      tracemalloc. Slows down allocation heavy stages.
+    """
+    global _metrics_file, _records, _trace_memory, _peak_stack
+    _metrics_file = file
+    _records = []
+    _peak_stack = []
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def close_metrics():
+    """ Stops the metrics recording started by open_metrics(...). """
+    global _metrics_file, _trace_memory
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _metrics_file = None
+    _trace_memory = False
+
+@contextlib.contextmanager
+def stage(name: str, **sizes):
+    """ Measures a stage of the computation.
+
+    Context manager measuring the wall time, the CPU time (including child processes, e.g. process pool workers) and
+    optionally the peak traced memory of the enclosed code. Stages can be nested, the traced peak of a stage includes
+    the peaks of its inner stages. The resident set size is only available as high-water mark of the whole process
+    ('process_maxrss_mb'), so the growth of this mark during the stage is recorded as well ('maxrss_growth_mb'). Problem
+    sizes (e.g. nd, nm or electrodes) can be passed as keyword arguments or added to the yielded dictionary within the
+    stage. Without an open metrics recording, the stage is not measured.
+
+    Parameter:
+        name: The name of the stage.
+        sizes: (optional) Problem sizes of the stage.
+
+    Typical usage example:
+        with metricsUtil.stage('compute_jacobian', nd=len(scheme('a'))) as record:
+            ...
+            record['nm'] = mesh.cellCount()
+    """
+    record = dict(sizes)
+    if _metrics_file is None:
+        yield record
+        return
+    if _trace_memory:
+        if len(_peak_stack) > 0:
+            # Keep the peak the enclosing stage reached so far, before it is reset for this stage
+            _peak_stack[-1] = max(_peak_stack[-1], tracemalloc.get_traced_memory()[1])
+        _peak_stack.append(0)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+    maxrss_start = _maxrss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = _cpu_time()
+    try:
+        yield record
+    finally:
+        maxrss = _maxrss_mb()
+        metrics = {'stage': name, 'wall_s': time.perf_counter() - wall_start, 'cpu_s': _cpu_time() - cpu_start,
+                   'process_maxrss_mb': maxrss, 'maxrss_growth_mb': maxrss - maxrss_start}
+        if _trace_memory:
+            traced_peak = max(_peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+            if len(_peak_stack) > 0:
+                _peak_stack[-1] = max(_peak_stack[-1], traced_peak)
+            metrics['traced_peak_mb'] = traced_peak / 2 ** 20
+        metrics.update({key: _to_json(value) for key, value in record.items()})
+        _records.append(metrics)
+        with open(_metrics_file, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+
+def summarize():
+    """ Creates a summary table of all recorded stages.
+
+    Returns:
+        A list of strings containing the table lines (one line per stage name, in order of first occurrence).
+    """
+    stages = {}
+    for record in _records:
+        summary = stages.setdefault(record['stage'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                                      'maxrss_growth_mb': 0.0})
+        summary['count'] += 1
+        summary['wall_s'] += record['wall_s']
+        summary['cpu_s'] += record['cpu_s']
+        summary['maxrss_growth_mb'] += record['maxrss_growth_mb']
+    lines = ['{:<30} {:>6} {:>12} {:>12} {:>12} {:>16}'.format('stage', 'count', 'wall [s]', 'mean [s]', 'cpu [s]',
+                                                                'maxrss gain [MB]')]
+    for name, summary in stages.items():
+        lines.append('{:<30} {:>6d} {:>12.3f} {:>12.3f} {:>12.3f} {:>16.1f}'.format(
+            name, summary['count'], summary['wall_s'], summary['wall_s'] / summary['count'], summary['cpu_s'],
+            summary['maxrss_growth_mb']))
+    return lines
+
+def log_summary(file=None):
+    """ Writes the summary table (see summarize()) to the log and optionally to a file.
+
+    Parameter:
+        file: (optional) The file to write the summary table to.
+    """
+    lines = summarize()
+    logging.info('Stage metrics:')
+    for line in lines:
+        logging.info(line)
+    if file is not None:
+        with open(file, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+def _cpu_time():
+    """ Returns the CPU time of the process and its terminated child processes. """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def _maxrss_mb():
+    """ Returns the resident set size high-water mark of the process in MB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _to_json(value):
+    """ Converts numpy scalars to JSON serializable values. """
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
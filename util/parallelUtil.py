@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+def split_indices(count: int, chunk_size: int):
+    """ Splits a range of indices into consecutive chunks.
+
+    Parameter:
+        count: The count of indices to be split.
+        chunk_size: The maximum count of indices per chunk.
+
+    Returns:
+        A list of index arrays covering range(count) in order.
+    """
+    chunk_size = max(int(chunk_size), 1)
+    return [np.arange(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+
+def imap_chunks(function, tasks: list, workers=1):
+    """ Applies a function to every task, optionally in a process pool, and yields the results.
+
+    Utility function like map_chunks(...), which hands out every result as soon as it and all results of preceding
+    tasks are available. This allows consuming (e.g. persisting) results without holding all of them.
+
+    Parameter:
+        function: The function to be applied to every task.
+        tasks: A list of task arguments. Every task is passed as single argument.
+        workers: (optional) The count of worker processes. 1 runs all tasks in the calling process.
+
+    Returns:
+        A generator of the task results in task order.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        for result in executor.map(function, tasks):
+            yield result
+
+def map_chunks(function, tasks: list, workers=1):
+    """ Applies a function to every task, optionally in a process pool.
+
+    Utility function to distribute independent chunks of work (e.g. Jacobian or simulation chunks) to worker processes.
+    The results are returned in the order of the tasks, regardless of the order in which the workers finish. function
+    has to be defined at module level and tasks have to be picklable when more than one worker is used.
+
+    Parameter:
+        function: The function to be applied to every task.
+        tasks: A list of task arguments. Every task is passed as single argument.
+        workers: (optional) The count of worker processes. 1 runs all tasks in the calling process.
+
+    Returns:
+        A list with the results of all tasks.
+    """
+    return list(imap_chunks(function=function, tasks=tasks, workers=workers))
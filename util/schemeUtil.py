@@ -1,226 +1,174 @@
 #!/usr/bin/env python
 
-import os
 import logging
 
+import numpy as np
 import pybert as pb
+import pygimli as pg
 
-def merge_schemes(scheme1: pb.DataContainerERT, scheme2: pb.DataContainerERT, tmp_dir: str, remove_tmp_file=True):
+from util.ElectrodeRegistry import ElectrodeRegistry
+from util.containerUtil import create_scheme
+from util.QuadrupoleTable import QuadrupoleTable
+from util.SchemeView import SchemeView
+
+# Tokens of the electrode indices and the data columns of a scheme
+SENSOR_TOKENS = ['a', 'b', 'm', 'n']
+DATA_TOKENS = ['err', 'i', 'ip', 'iperr', 'k', 'r', 'rhoa', 'u', 'valid']
+
+def get_sensor_positions(scheme: pb.DataContainerERT):
+    """ Returns the sensor positions of a scheme as numpy array.
+
+    Parameter:
+        scheme: The scheme containing the sensors.
+
+    Returns:
+        The sensor positions as array with one row (x, y, z) per sensor.
+    """
+    positions = scheme.sensorPositions()
+    return np.array([[positions[i][0], positions[i][1], positions[i][2]] for i in range(len(positions))]).reshape(-1, 3)
+
+def get_columns(scheme: pb.DataContainerERT, tokens=None):
+    """ Returns data columns of a scheme as numpy arrays.
+
+    Utility function to fetch every requested column exactly once. Electrode index columns are returned as integer
+    arrays (-1 marks an unused electrode), all other columns as float arrays.
+
+    Parameter:
+        scheme: The scheme containing the data.
+        tokens: (optional) The tokens of the requested columns. Defaults to all sensor and data tokens.
+
+    Returns:
+        A dictionary mapping every token to its column.
+    """
+    if tokens is None:
+        tokens = SENSOR_TOKENS + DATA_TOKENS
+    columns = {}
+    for token in tokens:
+        if token in SENSOR_TOKENS:
+            columns[token] = np.array(scheme(token), dtype=np.int64)
+        else:
+            columns[token] = np.array(scheme(token), dtype=float)
+    return columns
+
+def merge_schemes(scheme1: pb.DataContainerERT, scheme2: pb.DataContainerERT, tolerance=1e-6):
     """ Merges to schemes while prioritizing the first one.
 
     Utility function to merge to schemes. Electrode positions can differ. Electrodes on same positions will be merged.
     When multiple measurements are available for the same electrode configuration, the data from scheme1 will be used.
+    The merge works on whole data columns and identifies configurations by their canonical keys (see
+    QuadrupoleTable), so the merged scheme is created directly in memory.
 
     Parameter:
         scheme1: First scheme to be merged. This scheme will be prioritized.
         scheme2: Second scheme to be merged.
-        tmp_dir: Directory to temporarily store files in.
-        remove_tmp_file: (optional) Whether the temporary file(s) should be removed when no longer necessary. Should
-                         only be disabled for debugging purposes.
+        tolerance: (optional) The highest distance of two electrode positions which are merged (see ElectrodeRegistry).
 
     Returns:
         The merged scheme.
     """
-    logging.info('Merging datasets with %d and %d entries', len(scheme1('rhoa')), len(scheme2('rhoa')))
-    # Create global electrode register
-    electrodes = []
-    scheme1_electrodes = scheme1.sensorPositions()
-    for i in range(len(scheme1_electrodes)):
-        electrodes.append(scheme1_electrodes[i])
-    scheme2_electrodes = scheme2.sensorPositions()
-    for i in range(len(scheme2_electrodes)):
-        if scheme2_electrodes[i] not in electrodes:
-            electrodes.append(scheme2_electrodes[i])
-    # Create electrode dictionaries
-    scheme1_dic = {-1: -1}
-    for i in range(len(scheme1_electrodes)):
-        scheme1_dic.update({i: i})
-    scheme2_dic = {-1: -1}
-    for i in range(len(scheme2_electrodes)):
-        for j in range(len(electrodes)):
-            if scheme2_electrodes[i] == electrodes[j]:
-                scheme2_dic.update({i: j})
-    # Merge data
-    # (sensors: a b m n)
-    # (data: err i ip iperr k r rhoa u valid)
-    scheme_sensors = []
-    scheme_data = []
-    for i in range(len(scheme1('rhoa'))):
-        scheme_sensors.append([
-            scheme1_dic[scheme1('a')[i]]+1,
-            scheme1_dic[scheme1('b')[i]]+1,
-            scheme1_dic[scheme1('m')[i]]+1,
-            scheme1_dic[scheme1('n')[i]]+1
-        ])
-        scheme_data.append([
-            scheme1('err')[i],
-            scheme1('i')[i],
-            scheme1('ip')[i],
-            scheme1('iperr')[i],
-            scheme1('k')[i],
-            scheme1('r')[i],
-            scheme1('rhoa')[i],
-            scheme1('u')[i],
-            scheme1('valid')[i],
-        ])
-
-    for i in range(len(scheme2('rhoa'))):
-        a = scheme2_dic[scheme2('a')[i]]+1
-        b = scheme2_dic[scheme2('b')[i]]+1
-        m = scheme2_dic[scheme2('m')[i]]+1
-        n = scheme2_dic[scheme2('n')[i]]+1
-        if [a, b, m, n] not in scheme_sensors:
-            scheme_sensors.append([
-                a,
-                b,
-                m,
-                n
-            ])
-            scheme_data.append([
-                scheme2('err')[i],
-                scheme2('i')[i],
-                scheme2('ip')[i],
-                scheme2('iperr')[i],
-                scheme2('k')[i],
-                scheme2('r')[i],
-                scheme2('rhoa')[i],
-                scheme2('u')[i],
-                scheme2('valid')[i],
-            ])
-    logging.info('Merging complete (%d entries)', len(scheme_data))
-
-    # Write to temporary file
-    tmp_file = tmp_dir + 'tmpMerge.shm'
-    f = open(tmp_file, 'w')
-    # - electrodes
-    f.write('%d\n' % len(electrodes))
-    f.write('# x y z\n')
-    for i in range(len(electrodes)):
-        f.write('%f %f %f\n' % (electrodes[i][0],electrodes[i][1],electrodes[i][2]))
-    # - data
-    f.write('%d\n' % len(scheme_data))
-    f.write('# a b m n err i ip iperr k r rhoa u valid \n')
-    for i in range(len(scheme_data)):
-        f.write('%d %d %d %d %f %f %f %f %f %f %f %f %d\n' % (
-            scheme_sensors[i][0],
-            scheme_sensors[i][1],
-            scheme_sensors[i][2],
-            scheme_sensors[i][3],
-            scheme_data[i][0],
-            scheme_data[i][1],
-            scheme_data[i][2],
-            scheme_data[i][3],
-            scheme_data[i][4],
-            scheme_data[i][5],
-            scheme_data[i][6],
-            scheme_data[i][7],
-            scheme_data[i][8]
-        ))
-    f.write('0\n')
-    f.close()
-    # Read file again to not generate any inconsistencies
-    result = pb.load(tmp_file)
-    if remove_tmp_file:
-        os.remove(tmp_file)
-    return result
-
-def find_duplicate_configurations(scheme1: pb.DataContainerERT, scheme2: pb.DataContainerERT):
+    columns1 = get_columns(scheme1, tokens=DATA_TOKENS)
+    columns2 = get_columns(scheme2, tokens=DATA_TOKENS)
+    logging.info('Merging datasets with %d and %d entries', scheme1.size(), scheme2.size())
+    # Create global electrode register and map both schemes to global electrodes
+    registry = ElectrodeRegistry(tolerance=tolerance)
+    table1 = QuadrupoleTable.from_scheme(scheme1, registry)
+    table2 = QuadrupoleTable.from_scheme(scheme2, registry)
+    # Merge data (scheme1 entries are kept, scheme2 entries only when not defined yet)
+    add = table1.union(table2)
+    table = QuadrupoleTable(a=np.concatenate([table1.a, table2.a[add]]), b=np.concatenate([table1.b, table2.b[add]]),
+                            m=np.concatenate([table1.m, table2.m[add]]), n=np.concatenate([table1.n, table2.n[add]]),
+                            registry=registry)
+    columns = {token: np.concatenate([columns1[token], columns2[token][add]]) for token in DATA_TOKENS}
+    logging.info('Merging complete (%d entries)', len(table))
+    return table.to_scheme(data=columns)
+
+def find_duplicate_configurations(scheme1: pb.DataContainerERT, scheme2: pb.DataContainerERT, tolerance=1e-6):
     """ Finds configurations of scheme1 which are also defined in scheme2.
 
-    Utility function to find duplicates electrode configurations contained in both schemes.
+    Utility function to find duplicates electrode configurations contained in both schemes. Electrodes of both schemes
+    are matched by position (see ElectrodeRegistry) and configurations by their canonical keys in one sort-join (see
+    QuadrupoleTable). Configurations of scheme2 which are not contained in scheme1 are logged and marked in the mapping.
 
     Parameter:
         scheme1: The first scheme to be checked for duplicates.
         scheme2: The second scheme to be checked for duplicates.
+        tolerance: (optional) The highest distance of two electrode positions which are considered as the same
+                   electrode.
 
     Returns:
-        The duplicate indices of scheme1.
+        The duplicate indices of scheme1 and the mapping of every scheme2 configuration to its scheme1 index (-1 if it
+        is not contained in scheme1).
     """
     logging.info('Finding duplicate configurations for datasets with %d and %d entries',
-                 len(scheme1('rhoa')), len(scheme2('rhoa')))
-    # Create global electrode register
-    electrodes = []
-    scheme1_electrodes = scheme1.sensorPositions()
-    for i in range(len(scheme1_electrodes)):
-        electrodes.append(scheme1_electrodes[i])
-    scheme2_electrodes = scheme2.sensorPositions()
-    # Create electrode dictionaries
-    scheme1_dic = {-1: -1}
-    for i in range(len(scheme1_electrodes)):
-        scheme1_dic.update({i: i})
-    scheme2_dic = {-1: -1}
-    for i in range(len(scheme2_electrodes)):
-        for j in range(len(electrodes)):
-            if scheme2_electrodes[i] == electrodes[j]:
-                scheme2_dic.update({i: j})
-    # Subtract configurations
-    scheme_sensors = []
-    for i in range(len(scheme1('rhoa'))):
-        scheme_sensors.append([
-            scheme1_dic[scheme1('a')[i]],
-            scheme1_dic[scheme1('b')[i]],
-            scheme1_dic[scheme1('m')[i]],
-            scheme1_dic[scheme1('n')[i]]
-        ])
-    indices = []
-    for i in range(len(scheme2('rhoa'))):
-        indices.append(scheme_sensors.index([
-            scheme2_dic[scheme2('a')[i]],
-            scheme2_dic[scheme2('b')[i]],
-            scheme2_dic[scheme2('m')[i]],
-            scheme2_dic[scheme2('n')[i]]
-        ]))
-    logging.info('Finding duplicates complete (%d entries)', len(indices))
-    return indices
-
-def extract_configs_from_scheme(scheme: pb.DataContainerERT, config_indices: list, tmp_dir: str, remove_tmp_file=True):
+                 scheme1.size(), scheme2.size())
+    # Create global electrode register and map both schemes to global electrodes
+    registry = ElectrodeRegistry(tolerance=tolerance)
+    table1 = QuadrupoleTable.from_scheme(scheme1, registry)
+    table2 = QuadrupoleTable.from_scheme(scheme2, registry)
+    # Find the first scheme1 index of every scheme2 configuration
+    mapping = table1.match(table2)
+    missing = np.nonzero(mapping < 0)[0]
+    if len(missing) > 0:
+        logging.info('%d configurations of scheme2 are not contained in scheme1 (e.g. index %d)',
+                     len(missing), missing[0])
+    duplicate_indices = mapping[mapping >= 0]
+    logging.info('Finding duplicates complete (%d entries)', len(duplicate_indices))
+    return duplicate_indices, mapping
+
+def extract_configs_from_scheme(scheme: pb.DataContainerERT, config_indices: list, view=False):
     """ Extract specific electrode configurations from scheme.
 
-    Utility function to extract specific electrode configurations (identified by index) from a given scheme. Extracted
-    data will be returned in a separate scheme.
+    Utility function to extract specific electrode configurations (identified by index) from a given scheme. Every
+    column is fetched once and reduced to the extracted configurations. Extracted data will be returned in a separate
+    scheme or, in view mode, as SchemeView referencing the given scheme.
 
     Parameter:
         scheme: The scheme the electrode configurations should be extracted from.
         config_indices: The indices of the configurations to be extracted.
-        tmp_dir: Directory to temporarily store files in.
-        remove_tmp_file: (optional) Whether the temporary file(s) should be removed when no longer necessary. Should
-                         only be disabled for debugging purposes.
+        view: (optional) Whether a SchemeView should be returned instead of a separate scheme. Views can be used with
+              the other schemeUtil functions, but have to be converted (view=False) when pybert needs a scheme.
 
     Returns:
-        A scheme containing the extracted configurations.
+        A scheme (or SchemeView) containing the extracted configurations.
     """
     logging.info('Extracting configs from scheme...')
-    tmp_file = tmp_dir + 'tmpExtract.shm'
-    f = open(tmp_file, 'w')
-    # Write electrodes to file
-    electrodes = scheme.sensorPositions()
-    f.write('%d\n' % len(electrodes))
-    f.write('# x y z\n')
-    for i in range(len(electrodes)):
-        f.write('%f %f %f\n' % (electrodes[i][0], electrodes[i][1], electrodes[i][2]))
-    # Extract configurations and write to file
-    f.write('%d\n' % len(config_indices))
-    f.write('# a b m n err i ip iperr k r rhoa u valid \n')
-    for i in config_indices:
-        f.write('%d %d %d %d %f %f %f %f %f %f %f %f %d\n' % (
-            scheme('a')[i]+1,
-            scheme('b')[i]+1,
-            scheme('m')[i]+1,
-            scheme('n')[i]+1,
-            scheme('err')[i],
-            scheme('i')[i],
-            scheme('ip')[i],
-            scheme('iperr')[i],
-            scheme('k')[i],
-            scheme('r')[i],
-            scheme('rhoa')[i],
-            scheme('u')[i],
-            scheme('valid')[i]
-        ))
-    f.write('0\n')
-    f.close()
-    # Read file again to not generate any inconsistencies
-    result = pb.load(tmp_file)
-    if remove_tmp_file:
-        os.remove(tmp_file)
-    return result
\ No newline at end of file
+    config_indices = np.asarray(config_indices, dtype=int)
+    if view:
+        return SchemeView(scheme=scheme, indices=config_indices)
+    columns = {token: column[config_indices] for token, column in get_columns(scheme).items()}
+    return create_scheme(sensor_positions=get_sensor_positions(scheme), columns=columns)
+
+def create_comprehensive_scheme(electrodes: np.ndarray, scheme_names: list, thinning_factors: list):
+    """ Creates a scheme containing the configurations of several scheme types and electrode thinnings.
+
+    Utility function to build a pool of electrode configurations in one pass. For every scheme type and thinning
+    factor, the configurations are created on the thinned-out electrode set (every thinning_factor-th electrode) and
+    their electrode indices are mapped onto the full electrode set. All configurations are de-duplicated by their
+    canonical keys (see QuadrupoleTable, keeping the first occurrence, ordered by scheme type and thinning factor) and
+    the scheme is created once.
+
+    Parameter:
+        electrodes: The x-positions of the full electrode set.
+        scheme_names: The pybert names of the scheme types, e.g. ['wa', 'dd'].
+        thinning_factors: The thinning factors to be used (1 for the full electrode set).
+
+    Returns:
+        The created scheme.
+    """
+    electrodes = np.asarray(electrodes, dtype=float)
+    quadrupoles = {token: [] for token in SENSOR_TOKENS}
+    for scheme_name in scheme_names:
+        logging.info('Create configurations of type: ' + scheme_name)
+        for factor in thinning_factors:
+            factor = int(factor)
+            scheme = pb.createData(elecs=pg.RVector(electrodes[::factor]), schemeName=scheme_name)
+            for token, column in get_columns(scheme, tokens=SENSOR_TOKENS).items():
+                quadrupoles[token].append(np.where(column >= 0, column * factor, -1))
+    columns = {token: np.concatenate(column) if len(column) > 0 else np.zeros(0, dtype=np.int64)
+               for token, column in quadrupoles.items()}
+    registry = ElectrodeRegistry()
+    registry.register(np.column_stack([electrodes, np.zeros(len(electrodes)), np.zeros(len(electrodes))]))
+    table = QuadrupoleTable(registry=registry, **columns)
+    first_indices = table.unique()
+    logging.info('Comprehensive scheme created (%d of %d entries)', len(first_indices), len(table))
+    return table.subset(first_indices).to_scheme()
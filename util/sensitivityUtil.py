@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+import heapq
+
+import numpy as np
+
+def normalize_rows(matrix: np.ndarray):
+    """ Normalizes the rows of a matrix to unit length.
+
+    Utility function to scale every row of a sensitivity matrix to an euclidean norm of 1. Rows with a norm of 0 stay
+    unchanged, so they never appear to be linearly dependent.
+
+    Parameter:
+        matrix: The matrix whose rows should be normalized.
+
+    Returns:
+        A new matrix with normalized rows.
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1
+    return matrix / norms[:, np.newaxis]
+
+def compute_max_li(j_base_norm: np.ndarray, rows: np.ndarray):
+    """ Computes the highest li value of every row compared with the base configurations.
+
+    Parameter:
+        j_base_norm: Sensitivities of configurations already in use, normalized by normalize_rows(...).
+        rows: Sensitivities of the configurations to be checked.
+
+    Returns:
+        The highest absolute cosine similarity of every row with any base row (0 without base rows).
+    """
+    if len(j_base_norm) == 0:
+        return np.zeros(len(rows))
+    return np.max(np.abs(np.matmul(normalize_rows(np.asarray(rows, dtype=float)), j_base_norm.T)), axis=1)
+
+def screen_linear_independence(j_base: np.ndarray, j_add: np.ndarray, candidate_order: np.ndarray,
+                               li_threshold: float, max_count=None, block_size=512):
+    """ Screens candidate configurations for linear independence from the base configurations.
+
+    Utility function to select candidate configurations whose sensitivities are not too similar to any configuration
+    already in use. The li value of a candidate is the absolute cosine similarity between its sensitivity row and a base
+    row. A candidate is accepted when all its li values are below li_threshold. The base rows are normalized once and
+    the candidates are evaluated block-wise in the given order with a single matrix product per block.
+
+    Parameter:
+        j_base: Sensitivities of configurations already in use.
+        j_add: Sensitivities of configurations not in use. Can also be a JacobianStore or JacobianView.
+        candidate_order: Indices of j_add in the order they should be checked (e.g. ranked by goodness).
+        li_threshold: The highest li value which still leads to rejecting a configuration.
+        max_count: (optional) Stop screening when this many candidates were accepted. None screens all candidates.
+        block_size: (optional) Number of candidates evaluated per matrix product.
+
+    Returns:
+        The accepted indices of j_add (in screening order) and the number of candidates which had to be checked.
+    """
+    candidate_order = np.asarray(candidate_order, dtype=int)
+    if max_count is None:
+        max_count = len(candidate_order)
+    if max_count <= 0:
+        return np.zeros(0, dtype=int), 0
+    # Without base configurations every candidate is independent
+    if len(j_base) == 0:
+        accepted = candidate_order[0:max_count]
+        return accepted, len(accepted)
+    j_base_norm = normalize_rows(np.asarray(j_base))
+    accepted = []
+    checked = 0
+    for start in range(0, len(candidate_order), block_size):
+        block = candidate_order[start:start + block_size]
+        li = compute_max_li(j_base_norm=j_base_norm, rows=j_add[block])
+        block_accepted = np.nonzero(li < li_threshold)[0]
+        missing = max_count - len(accepted)
+        if len(block_accepted) >= missing:
+            block_accepted = block_accepted[0:missing]
+            accepted.extend(block[block_accepted])
+            checked += block_accepted[-1] + 1
+            break
+        accepted.extend(block[block_accepted])
+        checked += len(block)
+    return np.array(accepted, dtype=int), checked
+
+def compute_weighting_vector(j_compr: np.ndarray, nd: int, block_size=4096):
+    """ Computes the sensitivity weighting vector of the comprehensive configuration set.
+
+    Utility function to compute the summed absolute sensitivity of every mesh cell, normalized by the theoretical count
+    of configurations.
+
+    Parameter:
+        j_compr: Sensitivities of all possible configurations. Can also be a JacobianStore or JacobianView.
+        nd: The count of configurations used for normalization.
+        block_size: (optional) Number of Jacobian rows processed at once.
+
+    Returns:
+        The weighting vector with one entry per mesh cell.
+    """
+    gj_sum = np.zeros(j_compr.shape[1])
+    for block in _row_blocks(matrix=j_compr, block_size=block_size):
+        gj_sum += np.sum(np.abs(block), axis=0)
+    return gj_sum / nd
+
+def compute_goodness(j_add: np.ndarray, gj_sum: np.ndarray, r_base_diag: np.ndarray, r_compr_diag: np.ndarray,
+                     grad: np.ndarray, block_size=4096):
+    """ Computes the goodness function values of candidate configurations.
+
+    Utility function to score every candidate configuration by the resolution it adds to poorly resolved cells (based on
+    the ratio of the base and comprehensive resolution) and by the resistivity gradient criterion.
+
+    Parameter:
+        j_add: Sensitivities of configurations not in use. Can also be a JacobianStore or JacobianView.
+        gj_sum: Weighting vector as computed by compute_weighting_vector(...).
+        r_base_diag: Diagonal of the resolution matrix of the configurations in use.
+        r_compr_diag: Diagonal of the resolution matrix of all possible configurations.
+        grad: Normalized resistivity gradient per mesh cell.
+        block_size: (optional) Number of Jacobian rows processed at once.
+
+    Returns:
+        The resolution scores and the gradient scores, each as array with one entry per row of j_add.
+    """
+    cell_weights = (1 - r_base_diag / r_compr_diag) / gj_sum
+    res_gf = np.zeros(len(j_add))
+    for start, block in zip(range(0, len(j_add), block_size), _row_blocks(matrix=j_add, block_size=block_size)):
+        res_gf[start:start + len(block)] = np.matmul(np.abs(block), cell_weights)
+    # The gradient criterion sums over all cells and is therefore equal for every candidate
+    grad_gf = np.full(len(j_add), np.sum(grad))
+    return res_gf, grad_gf
+
+def compute_resolution_diagonal(jacobian: np.ndarray, rcond=1e-15, damping=0.0, rank=None, oversampling=10,
+                                power_iterations=2, seed=0, block_size=4096):
+    """ Computes the diagonal of the model resolution matrix.
+
+    Utility function to compute diag(pinv(J) * J) without building the pseudo-inverse or the full resolution matrix.
+    The diagonal equals the squared row norms of the right singular vectors of J, which are obtained from a thin SVD of
+    the triangular factor of a block-wise QR decomposition. Optionally, the singular values can be damped
+    (diag((J^T*J + damping*I)^-1 * J^T*J)) and a randomized SVD of the given rank can be used for very large matrices.
+
+    Parameter:
+        jacobian: The Jacobian (sensitivity) matrix. Can also be a JacobianStore or JacobianView.
+        rcond: (optional) Singular values smaller than rcond times the largest singular value are truncated. The
+               default equals the truncation of np.linalg.pinv.
+        damping: (optional) Damping factor added to the squared singular values. 0 disables damping.
+        rank: (optional) Rank of the randomized SVD. None computes the exact diagonal. The randomized result equals the
+              exact one when rank is at least the numerical rank of the Jacobian.
+        oversampling: (optional) Additional sample count of the randomized SVD.
+        power_iterations: (optional) Power iteration count of the randomized SVD.
+        seed: (optional) Seed of the random sampling matrix.
+        block_size: (optional) Number of Jacobian rows processed at once.
+
+    Returns:
+        The resolution matrix diagonal with one entry per mesh cell.
+    """
+    if rank is None:
+        singular_values, vt = _thin_svd(jacobian=jacobian, block_size=block_size)
+    else:
+        singular_values, vt = _randomized_svd(jacobian=jacobian, rank=rank, oversampling=oversampling,
+                                               power_iterations=power_iterations, seed=seed, block_size=block_size)
+    if len(singular_values) == 0:
+        return np.zeros(jacobian.shape[1])
+    # Truncate small singular values like np.linalg.pinv does
+    kept = singular_values > rcond * np.max(singular_values)
+    filter_factors = np.ones(np.count_nonzero(kept))
+    if damping > 0:
+        filter_factors = singular_values[kept] ** 2 / (singular_values[kept] ** 2 + damping)
+    return np.matmul(filter_factors, vt[kept] ** 2)
+
+def _row_blocks(matrix: np.ndarray, block_size: int):
+    """ Yields the matrix in blocks of rows.
+
+    Parameter:
+        matrix: The matrix to be split.
+        block_size: The maximum row count per block.
+
+    Returns:
+        A generator of row blocks.
+    """
+    for start in range(0, len(matrix), block_size):
+        yield np.asarray(matrix[start:start + block_size], dtype=float)
+
+def _tsqr(blocks, n_cols: int):
+    """ Computes the triangular factor of a QR decomposition from row blocks.
+
+    Parameter:
+        blocks: An iterable of row blocks of the decomposed matrix.
+        n_cols: The column count of the decomposed matrix.
+
+    Returns:
+        The upper triangular factor R with at most n_cols rows.
+    """
+    r = np.zeros((0, n_cols))
+    for block in blocks:
+        r = np.linalg.qr(np.vstack((r, block)), mode='r')
+    return r
+
+def _thin_svd(jacobian: np.ndarray, block_size: int):
+    """ Computes singular values and right singular vectors of a matrix.
+
+    Parameter:
+        jacobian: The decomposed matrix.
+        block_size: Number of rows processed at once.
+
+    Returns:
+        The singular values and the right singular vectors (as rows).
+    """
+    n_rows, n_cols = jacobian.shape
+    # Tall matrices share singular values and right singular vectors with their triangular QR factor
+    if n_rows > n_cols:
+        jacobian = _tsqr(blocks=_row_blocks(matrix=jacobian, block_size=block_size), n_cols=n_cols)
+    else:
+        jacobian = np.asarray(jacobian[0:n_rows], dtype=float)
+    _, singular_values, vt = np.linalg.svd(jacobian, full_matrices=False)
+    return singular_values, vt
+
+def _randomized_svd(jacobian: np.ndarray, rank: int, oversampling: int, power_iterations: int, seed: int,
+                     block_size: int):
+    """ Approximates singular values and right singular vectors of a matrix with a randomized range finder.
+
+    Only matrices with n_cols x (rank + oversampling) entries are kept in memory besides the processed row block.
+
+    Parameter:
+        jacobian: The decomposed matrix.
+        rank: The rank of the approximation.
+        oversampling: Additional sample count.
+        power_iterations: Power iteration count.
+        seed: Seed of the random sampling matrix.
+        block_size: Number of rows processed at once.
+
+    Returns:
+        The approximated singular values and right singular vectors (as rows).
+    """
+    n_cols = jacobian.shape[1]
+    n_samples = min(rank + oversampling, n_cols)
+    random_state = np.random.RandomState(seed)
+    # Sample the row space of the Jacobian
+    sample = np.zeros((n_cols, n_samples))
+    for block in _row_blocks(matrix=jacobian, block_size=block_size):
+        sample += np.matmul(block.T, random_state.standard_normal((len(block), n_samples)))
+    basis, _ = np.linalg.qr(sample)
+    for _ in range(power_iterations):
+        sample = np.zeros((n_cols, n_samples))
+        for block in _row_blocks(matrix=jacobian, block_size=block_size):
+            sample += np.matmul(block.T, np.matmul(block, basis))
+        basis, _ = np.linalg.qr(sample)
+    # Decompose the Jacobian projected onto the sampled row space
+    r = _tsqr(blocks=(np.matmul(block, basis) for block in _row_blocks(matrix=jacobian, block_size=block_size)),
+               n_cols=n_samples)
+    _, singular_values, vt = np.linalg.svd(r, full_matrices=False)
+    return singular_values[0:rank], np.matmul(vt[0:rank], basis.T)
+
+def compute_row_space_basis(jacobian: np.ndarray, rcond=1e-15, block_size=4096):
+    """ Computes an orthonormal basis of the row space of a matrix.
+
+    Utility function to factorize a Jacobian for incremental resolution updates. The basis consists of the right
+    singular vectors belonging to the singular values kept by the truncation of compute_resolution_diagonal(...).
+
+    Parameter:
+        jacobian: The Jacobian (sensitivity) matrix. Can also be a JacobianStore or JacobianView.
+        rcond: (optional) Singular values smaller than rcond times the largest singular value are truncated.
+        block_size: (optional) Number of Jacobian rows processed at once.
+
+    Returns:
+        The basis as matrix with one column per basis vector (n_cols x rank).
+    """
+    singular_values, vt = _thin_svd(jacobian=jacobian, block_size=block_size)
+    if len(singular_values) == 0:
+        return np.zeros((jacobian.shape[1], 0))
+    return vt[singular_values > rcond * np.max(singular_values)].T
+
+def append_to_row_space_basis(basis: np.ndarray, rows: np.ndarray, tolerance=1e-10):
+    """ Extends an orthonormal row space basis by additional matrix rows.
+
+    Utility function to update a basis computed by compute_row_space_basis(...) when rows are appended to the
+    factorized matrix. The rows are orthogonalized against the basis (classical Gram-Schmidt with one
+    re-orthogonalization) in O(n_cols * rank) per row.
+
+    Parameter:
+        basis: The orthonormal basis (n_cols x rank).
+        rows: The appended matrix rows.
+        tolerance: (optional) Rows whose remaining norm relative to their original norm is not larger than this value
+                   are considered linearly dependent and do not extend the basis.
+
+    Returns:
+        The extended basis.
+    """
+    rows = np.asarray(rows)
+    if len(rows) == 0:
+        return basis
+    residuals = rows - np.matmul(np.matmul(rows, basis), basis.T)
+    row_norms = np.linalg.norm(rows, axis=1)
+    new_vectors = []
+    for i in range(len(rows)):
+        residual = residuals[i]
+        for _ in range(2):
+            residual = residual - np.matmul(basis, np.matmul(basis.T, residual))
+            for vector in new_vectors:
+                residual = residual - np.dot(vector, residual) * vector
+        residual_norm = np.linalg.norm(residual)
+        if residual_norm > tolerance * row_norms[i]:
+            new_vectors.append(residual / residual_norm)
+    if len(new_vectors) == 0:
+        return basis
+    return np.hstack((basis, np.array(new_vectors).T))
+
+def compute_resolution_diagonal_from_basis(basis: np.ndarray):
+    """ Computes the diagonal of the model resolution matrix from an orthonormal row space basis.
+
+    Parameter:
+        basis: The orthonormal basis (n_cols x rank) as computed by compute_row_space_basis(...).
+
+    Returns:
+        The resolution matrix diagonal with one entry per mesh cell.
+    """
+    return np.sum(basis ** 2, axis=1)
+
+def select_greedy_orthogonal(basis: np.ndarray, j_add: np.ndarray, candidate_order: np.ndarray, li_threshold: float,
+                             max_count=None, block_size=512):
+    """ Greedily selects candidate configurations which are linearly independent from all accepted configurations.
+
+    Utility function to select candidate configurations in the given order while keeping an orthonormal basis of all
+    accepted sensitivities (the configurations in use and the candidates selected so far). The li value of a candidate
+    is the norm of its normalized sensitivity row projected onto this basis, i.e. the cosine of the angle between the
+    row and the spanned subspace. A candidate is accepted when its li value is below li_threshold and the basis is
+    extended by its orthogonal remainder. Candidates without any sensitivity are never accepted.
+
+    Parameter:
+        basis: Orthonormal basis (n_cols x rank) of the sensitivities in use, e.g. computed by
+               compute_row_space_basis(...).
+        j_add: Sensitivities of configurations not in use. Can also be a JacobianStore or JacobianView.
+        candidate_order: Indices of j_add in the order they should be checked (e.g. ranked by goodness).
+        li_threshold: The highest li value which still leads to rejecting a configuration.
+        max_count: (optional) Stop selecting when this many candidates were accepted. None screens all candidates.
+        block_size: (optional) Number of candidates projected onto the basis per matrix product.
+
+    Returns:
+        The accepted indices of j_add (in screening order), the number of candidates which had to be checked and the
+        extended basis.
+    """
+    candidate_order = np.asarray(candidate_order, dtype=int)
+    if max_count is None:
+        max_count = len(candidate_order)
+    accepted = []
+    checked = 0
+    for start in range(0, len(candidate_order), block_size):
+        if len(accepted) >= max_count:
+            break
+        block = candidate_order[start:start + block_size]
+        # Project the whole block onto the basis known at block start
+        residuals = normalize_rows(np.asarray(j_add[block], dtype=float))
+        residuals = residuals - np.matmul(np.matmul(residuals, basis), basis.T)
+        block_vectors = []
+        for i in range(len(block)):
+            checked += 1
+            residual = residuals[i]
+            for vector in block_vectors:
+                residual = residual - np.dot(vector, residual) * vector
+            residual_norm = np.linalg.norm(residual)
+            li = np.sqrt(max(0.0, 1 - residual_norm ** 2))
+            if li < li_threshold and residual_norm > 0:
+                # Re-orthogonalize to keep the basis numerically orthonormal
+                residual = residual - np.matmul(basis, np.matmul(basis.T, residual))
+                for vector in block_vectors:
+                    residual = residual - np.dot(vector, residual) * vector
+                block_vectors.append(residual / np.linalg.norm(residual))
+                accepted.append(block[i])
+                if len(accepted) >= max_count:
+                    break
+        if len(block_vectors) > 0:
+            basis = np.hstack((basis, np.array(block_vectors).T))
+    return np.array(accepted, dtype=int), checked, basis
+
+def update_top_candidates(heap: list, scores: np.ndarray, indices: np.ndarray, count: int):
+    """ Keeps the highest scored candidates of a stream of candidate blocks.
+
+    Utility function to maintain a min-heap of (score, index) tuples holding at most count candidates. Equal scores are
+    ranked by the higher index, like a reversed argsort does.
+
+    Parameter:
+        heap: The heap (list) to be updated in place. Start with an empty list.
+        scores: The scores of the candidates of the current block.
+        indices: The indices identifying the candidates of the current block.
+        count: The maximum count of candidates kept.
+    """
+    if count <= 0 or len(scores) == 0:
+        return
+    # Only the best candidates of a block can enter the heap
+    if len(scores) > count:
+        best = np.argpartition(scores, len(scores) - count)[len(scores) - count:]
+        scores = scores[best]
+        indices = indices[best]
+    for score, index in zip(scores, indices):
+        item = (float(score), int(index))
+        if len(heap) < count:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)